@@ -1,9 +1,13 @@
 import os
 from modules.compiler import Compiler
 from modules.data_loader import DataLoader
+from modules.distributed import Coordinator, run_node
 from modules.arg_parser import ArgParser
 from modules.fuzzer import Fuzzer
+from modules.journal import Journal
+from modules.reducer import Reducer
 from modules.strategies.mutator import Mutator
+from modules.telemetry import TelemetryWriter, telemetry
 from utils.utils import load_checkpoint, write_checkpoint
 
 def main():
@@ -15,9 +19,10 @@ def main():
     mutator = Mutator()
     tests = data_loader.tests()
     
+    # the nodes on the same machine share these folders, and only the coordinator writes the results
     folders_used = {
-        "err": True,
-        ".tmp": True,
+        "err": not args.node,
+        ".tmp": not args.node,
         args.output: False # False means that the folder will not be emptied
     }
 
@@ -28,20 +33,53 @@ def main():
             for file in os.listdir(folder):
                 os.remove(os.path.join(folder, file))
 
-    loaded_interesting_tests = load_checkpoint(args.resume) if args.resume else []
+    progress = None
+    if args.resume and args.resume.endswith(".jsonl"):
+        progress, loaded_interesting_tests = Journal.replay(args.resume)
+    else:
+        loaded_interesting_tests = load_checkpoint(args.resume) if args.resume else []
+    journal = Journal(args.journal) if args.journal and not args.node else None
+    telemetry_writer = TelemetryWriter(args.telemetry, args.telemetry_interval) if args.telemetry else None
         
-    fuzzer = Fuzzer(tests=tests, compiler=compiler, num_cores=args.num_cores, n_threshold=args.threshold, mutator=mutator, data_loader=data_loader)
-    interesting_tests = fuzzer.fuzz(loaded_interesting_tests) + loaded_interesting_tests
+    fuzzer = Fuzzer(tests=tests, compiler=compiler, num_cores=args.num_cores, n_threshold=args.threshold, mutator=mutator, data_loader=data_loader, batch_size=args.batch_size, count_instructions=args.count_instructions, strategy_scheduler=args.strategy_scheduler, seed_scheduler=args.seed_scheduler, search=args.search, population_size=args.population, generation_workers=args.generation_workers, asan_workers=args.asan_workers, telemetry_writer=telemetry_writer, journal=journal, progress=progress)
+    if args.node:
+        run_node(fuzzer, args.node, args.authkey, args.lease_seconds)
+        return
+
+    if args.coordinator:
+        coordinator = Coordinator(fuzzer, args.coordinator, args.authkey, args.lease_seconds)
+        interesting_tests = coordinator.serve(loaded_interesting_tests) + loaded_interesting_tests
+    else:
+        interesting_tests = fuzzer.fuzz(loaded_interesting_tests) + loaded_interesting_tests
+    if journal is not None:
+        journal.close()
+
+    if args.reduce:
+        reducer = Reducer(compiler, workers=args.num_cores)
+        for stats in interesting_tests:
+            if stats.reduced_content is not None:
+                continue
+            reduced = reducer.reduce(stats)
+            stats.reduced_content = reduced.file_content
+            path = data_loader.save_reduced(stats, reduced)
+            print(f"Reduced {stats.file_name} from {len(stats.file_content)} to {len(reduced.file_content)} bytes: {path}")
     
     write_checkpoint("checkpoint.json", interesting_tests)
     
     print(f"Found {len(interesting_tests)} interesting tests")
+
+    if compiler.cache is not None:
+        # the lookups of this run, counted by every process and merged in the telemetry of the main one
+        hits = telemetry.counters.get(("compile_cache", "hit"), 0)
+        misses = telemetry.counters.get(("compile_cache", "miss"), 0)
+        print(f"Compile cache: {hits} hits, {misses} misses, {compiler.cache.entries()} entries")
     
-    print("Clean up in progress")
-    for root, dirs, files in os.walk(args.input):
-        for file in files:
-            if file.startswith("tmp_"):
-                os.remove(os.path.join(root, file))
+    if not args.pipe:
+        print("Clean up in progress")
+        for root, dirs, files in os.walk(args.input):
+            for file in files:
+                if file.startswith("tmp_"):
+                    os.remove(os.path.join(root, file))
 
         
     
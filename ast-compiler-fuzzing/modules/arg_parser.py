@@ -1,7 +1,10 @@
 import argparse
 import multiprocessing
+import os
 import shutil
 import subprocess
+from modules.process import can_limit
+from modules.toolchain import ToolchainManifest
 
 class ArgParser:
     """ This class is used to parse the command line arguments. """
@@ -15,29 +18,105 @@ class ArgParser:
         self.parser.add_argument("-i", "--input", help="Specify the test data directory", default="input")
         self.parser.add_argument("-o", "--output", help="Specify the data analysis directory", default="output")
         self.parser.add_argument("-O", "--optimization-level", type=int, choices=[1, 2, 3], help="Specify the optimization level of GCC (1, 2, or 3)", default=3)
-        self.parser.add_argument("-r", "--resume", help="Specify which checkpoint to use, if any.",  default=None)
+        self.parser.add_argument("-r", "--resume", help="Specify which checkpoint to use, if any. A journal (.jsonl) also restores the search state of each seed.",  default=None)
+        self.parser.add_argument("-m", "--metric", choices=["lines", "size"], help="Specify the metric compared across compilers: lines of assembly or bytes of object code", default="lines")
+        self.parser.add_argument("-s", "--strategy-scheduler", choices=["fixed", "bandit"], help="Specify how the mutation strategies are chosen: fixed sequence or multi-armed bandit", default="fixed")
+        self.parser.add_argument("--seed-scheduler", choices=["uniform", "energy"], help="Specify how the seeds are scheduled: same budget for all or energy based on their progress", default="uniform")
+        self.parser.add_argument("--search", choices=["random", "evolutionary"], help="Specify how the best mutation of a seed is searched: independent random mutations or a population evolved by selection, crossover and mutation", default="random")
+        self.parser.add_argument("--population", help="Specify the size of the population of the evolutionary search", default=16, type=int)
+        self.parser.add_argument("--generation-workers", help="Specify how many compilations of a generation of the evolutionary search run at the same time", default=1, type=int)
+        self.parser.add_argument("--asan-workers", help="Specify how many ASAN validations run at the same time in the main process while the workers keep mutating, 0 to validate in the workers", default=0, type=int)
+        self.parser.add_argument("--count-instructions", help="Confirm the interesting tests by counting the instructions they execute", action="store_true")
+        self.parser.add_argument("--instruction-cap", help="Specify the maximum number of instructions executed when counting them", default=1000000, type=int)
+        self.parser.add_argument("--cache", help="Specify the compile cache database", default=".cache/compile.db")
+        self.parser.add_argument("--cache-size", help="Specify the maximum size of the compile cache in MB", default=256, type=int)
+        self.parser.add_argument("--no-cache", help="Disable the compile cache", action="store_true")
+        self.parser.add_argument("-e", "--extractor", choices=["regex", "ast"], help="Specify how the inputs are extracted from the tests: line regexes or the syntax tree (needs tree-sitter)", default="regex")
+        self.parser.add_argument("--test-index", help="Specify the index of the analyzed tests, so that only new or modified files are analyzed again", default=".cache/tests.pickle")
+        self.parser.add_argument("--no-test-index", help="Analyze every test without using the index", action="store_true")
+        self.parser.add_argument("--compile-timeout", help="Specify the seconds after which a compilation is killed, the upper bound of the adaptive timeouts", default=5, type=float)
+        self.parser.add_argument("--run-timeout", help="Specify the seconds after which a sanitized binary is killed, the upper bound of the adaptive timeouts", default=10, type=float)
+        self.parser.add_argument("--timeout-factor", help="Adapt the timeouts to the 99th percentile of the recent latencies of each seed and compiler times this factor", default=None, type=float)
+        self.parser.add_argument("--memory-limit", help="Specify the MB of address space of each compiler process and of resident memory of each sanitized binary", default=None, type=int)
+        self.parser.add_argument("--parallel-compilers", help="Specify how many compilers can run at the same time in each worker process, i.e. up to num_cores times this number in total", default=1, type=int)
+        self.parser.add_argument("--toolchain-manifest", help="Specify the file caching the resolved compilers", default=".cache/toolchain.json")
+        self.parser.add_argument("--refresh-toolchain", help="Resolve the compilers again even if the toolchain manifest is valid", action="store_true")
+        self.parser.add_argument("--preprocess", help="Expand the headers of the tests once instead of at every compilation", action="store_true")
+        self.parser.add_argument("--batch-size", help="Specify how many mutants are compiled by a single invocation of each compiler", default=1, type=int)
+        self.parser.add_argument("--pipe", help="Pipe the sources to the compilers instead of writing temporary files in the input directory", action="store_true")
+        self.parser.add_argument("--results-db", help="Specify a SQLite database where to store the interesting tests instead of a .txt file each", default=None)
+        self.parser.add_argument("--reduce", help="Reduce the interesting tests to the declarations, functions and statements that keep them interesting", action="store_true")
+        self.parser.add_argument("--journal", help="Specify a journal (.jsonl) where to append the progress of the campaign as it runs", default=None)
+        self.parser.add_argument("--telemetry", help="Specify a folder where to periodically write the latency of each stage (JSONL and Prometheus textfile)", default=None)
+        self.parser.add_argument("--telemetry-interval", help="Specify the seconds between two telemetry writes", default=30, type=float)
+        self.parser.add_argument("--coordinator", help="Coordinate a campaign over many nodes, leasing them the seeds on host:port or on a Unix socket path", default=None)
+        self.parser.add_argument("--node", help="Fuzz the seeds leased by the coordinator at host:port or at a Unix socket path", default=None)
+        self.parser.add_argument("--authkey", help="Specify the key shared by the coordinator and the nodes, by default $FUZZER_AUTHKEY", default=None)
+        self.parser.add_argument("--lease-seconds", help="Specify the seconds after which a seed leased to a node that stopped sending heartbeats is scheduled again", default=300, type=float)
            
         self.args = self.parser.parse_args()
         
-        if not self.__is_valid_compiler(self.args.compiler):
-            print(f"Could not find compiler {self.args.compiler}. Please specify the main compiler with -c.")
-            exit(1)
-        
-        self.__set_compiler_type_version(self.args.compiler)
+        toolchain = ToolchainManifest(self.args.toolchain_manifest)
+        manifest = None if self.args.refresh_toolchain else toolchain.load(self.args.compiler)
+
+        if manifest is None:
+            if not self.__is_valid_compiler(self.args.compiler):
+                print(f"Could not find compiler {self.args.compiler}. Please specify the main compiler with -c.")
+                exit(1)
+            
+            self.__set_compiler_type_version(self.args.compiler)
+            self.args.older_compilers = self.__get_older_compilers(self.args.compiler_version)
+            if len(self.args.older_compilers) > 0:
+                manifest = toolchain.write(self.args.compiler, self.args.compiler_type, self.args.compiler_version, self.args.older_compilers)
+        else:
+            self.args.compiler_type = manifest["compiler_type"]
+            self.args.compiler_version = manifest["compiler_version"]
+            self.args.older_compilers = manifest["older_compilers"]
+
         print(f"Using compiler {self.args.compiler_type} version {self.args.compiler_version}.")
 
-        self.args.older_compilers = self.__get_older_compilers(self.args.compiler_version)
         if len(self.args.older_compilers) == 0:
             print("No older compilers found. Make sure they're in your path. Exiting.")
             exit(1)
         print(f"Found {len(self.args.older_compilers)} older compilers: { ', '.join(self.args.older_compilers)}")
 
+        if self.args.metric == "size":
+            not_elf = [c for c, ok in manifest["elf"].items() if not ok]
+            if not_elf:
+                print(f"The size metric needs ELF objects, which these compilers do not produce: {', '.join(not_elf)}. Use -m lines.")
+                exit(1)
+
+        self.args.asan_support = manifest["asan"]
+        if not all(self.args.asan_support.values()):
+            print(f"Compilers that cannot build with -fsanitize=address: {', '.join(c for c, ok in self.args.asan_support.items() if not ok)}")
+
         if self.args.num_cores < 1 or multiprocessing.cpu_count() < self.args.num_cores:
             print(f"Invalid number of cores. Using {multiprocessing.cpu_count()} core.")
             self.args.num_cores = multiprocessing.cpu_count()
         
         self.args.flags = [f"-O{self.args.optimization_level}", "-fno-unroll-loops", "-w"]
         print(f"Using flags: {self.args.flags}")
+
+        if (self.args.memory_limit or self.args.timeout_factor) and not can_limit():
+            print("prlimit (util-linux) not found: the compilers and the sanitized binaries run without CPU and memory limits.")
+
+        if self.args.no_cache:
+            self.args.cache = None
+        if self.args.no_test_index:
+            self.args.test_index = None
+
+        if self.args.coordinator and self.args.node:
+            print("A process can be either the coordinator or a node.")
+            exit(1)
+        if (self.args.coordinator or self.args.node) and self.args.asan_workers > 0:
+            print("--asan-workers is not supported in a distributed campaign: the workers of the nodes validate the candidates with ASAN.")
+            exit(1)
+        if self.args.coordinator or self.args.node:
+            authkey = self.args.authkey or os.environ.get("FUZZER_AUTHKEY")
+            if not authkey:
+                print("Specify the key shared by the coordinator and the nodes with --authkey or FUZZER_AUTHKEY.")
+                exit(1)
+            self.args.authkey = authkey.encode()
         pass
 
     def __is_valid_compiler(self, compiler):
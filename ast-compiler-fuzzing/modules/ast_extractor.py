@@ -0,0 +1,165 @@
+import functools
+from modules.test import Input, Test
+
+
+_SUPPORTED_TYPES = ("int", "float", "double", "char", "long", "short")
+_LITERALS = ("number_literal", "char_literal")
+
+_parser = None
+
+
+def _get_parser():
+    """The tree-sitter C parser, created lazily since tree-sitter is an optional dependency."""
+    global _parser
+    if _parser is None:
+        try:
+            from tree_sitter import Language, Parser
+            import tree_sitter_c
+        except ImportError as e:
+            raise ImportError("The ast extractor needs tree-sitter and tree-sitter-c: pip install tree-sitter tree-sitter-c") from e
+        _parser = Parser(Language(tree_sitter_c.language()))
+    return _parser
+
+
+@functools.lru_cache(maxsize=128)
+def parse(source: bytes):
+    """Parse a C source, caching the trees of the most recent sources.
+
+    Args:
+        source (bytes): the source to parse
+
+    Returns:
+        tree_sitter.Tree: the syntax tree
+    """
+    return _get_parser().parse(source)
+
+
+def _base_type(type_node) -> str | None:
+    """The type of a declaration among the supported ones, e.g. long for `unsigned long int`."""
+    if type_node.type == "primitive_type":
+        text = type_node.text.decode()
+        return text if text in _SUPPORTED_TYPES else None
+
+    if type_node.type == "sized_type_specifier":
+        modifiers = [child.text.decode() for child in type_node.children if child.type != "primitive_type"]
+        inner = type_node.child_by_field_name("type")
+        inner = inner.text.decode() if inner is not None else "int"
+        if inner == "int" and "long" in modifiers:
+            return "long"
+        if inner == "int" and "short" in modifiers:
+            return "short"
+        return inner if inner in _SUPPORTED_TYPES else None
+
+    return None
+
+
+def _declarator_name(declarator) -> tuple[str, bool, int | None] | None:
+    """The name of a declarator, whether it is an array and its size; None for pointers, functions and nested arrays."""
+    if declarator.type == "identifier":
+        return declarator.text.decode(), False, None
+
+    if declarator.type == "array_declarator":
+        inner = declarator.child_by_field_name("declarator")
+        size = declarator.child_by_field_name("size")
+        if inner.type != "identifier":
+            return None
+        if size is None:
+            return inner.text.decode(), True, None
+        if size.type == "number_literal" and size.text.isdigit():
+            return inner.text.decode(), True, int(size.text)
+
+    return None
+
+
+def _value(node, base_type: str, is_array: bool) -> str | None:
+    """The value of an initializer, if it is a literal the mutators can handle."""
+    if not is_array:
+        return node.text.decode("ISO-8859-1") if node.type in _LITERALS else None
+
+    if node.type == "string_literal" and base_type == "char":
+        return node.text.decode("ISO-8859-1")
+
+    if node.type == "initializer_list" and node.named_child_count > 0 and all(child.type in _LITERALS for child in node.named_children):
+        # the mutators expect the elements on a single line separated by ", "
+        return "{" + ", ".join(child.text.decode("ISO-8859-1") for child in node.named_children) + "}"
+
+    return None
+
+
+def extract(name: str, file_contents: str) -> Test:
+    """Promote the constants of a test to inputs walking its syntax tree once.
+    Initialized declarations of the supported types and assignments of literals to scalar variables
+    become inputs, multi-line initializers included; struct members, parameters, pointers and the
+    initializers of for loops are left as they are.
+
+    Args:
+        name (str): path of the test
+        file_contents (str): content of the test
+
+    Returns:
+        Test: the processed test, whose inputs have the span they replace in file_contents
+    """
+
+    # each character of the decoded test is a byte, so the offsets of the tree are offsets in file_contents
+    source = file_contents.encode("ISO-8859-1")
+    tree = parse(source)
+
+    inputs = {}
+    spans = []
+    global_types = {}
+
+    # pre-order walk, with the types of the variables visible in the current function
+    stack = [(tree.root_node, None)]
+    while stack:
+        node, local_types = stack.pop()
+
+        if node.type == "function_definition":
+            local_types = {}
+
+        elif node.type == "declaration" and not node.has_error and node.parent.type != "for_statement":
+            base_type = _base_type(node.child_by_field_name("type"))
+            scope = 0 if local_types is None else 1
+            types = global_types if local_types is None else local_types
+
+            for declarator in node.children_by_field_name("declarator"):
+                value_node = None
+                if declarator.type == "init_declarator":
+                    value_node = declarator.child_by_field_name("value")
+                    declarator = declarator.child_by_field_name("declarator")
+
+                declared = _declarator_name(declarator)
+                if declared is None:
+                    continue
+                var_name, is_array, size = declared
+                types[var_name] = (base_type, is_array)
+
+                if base_type is None or value_node is None or (value := _value(value_node, base_type, is_array)) is None:
+                    continue
+
+                start, end = declarator.start_byte, value_node.end_byte
+                inputs[len(inputs)] = Input(name=var_name, value=value, scope=scope, is_declared=1, type=base_type, len=size, span=(start, end))
+                spans.append((start, end))
+            continue
+
+        elif node.type == "assignment_expression" and local_types is not None and not node.has_error and node.parent.type in ("expression_statement", "comma_expression"):
+            left, right = node.child_by_field_name("left"), node.child_by_field_name("right")
+            operator = node.child_by_field_name("operator")
+            if operator is not None and operator.type == "=" and left.type == "identifier" and right.type in _LITERALS:
+                var_name = left.text.decode()
+                base_type, is_array = local_types.get(var_name, global_types.get(var_name, (None, True)))
+                if base_type is not None and not is_array:
+                    inputs[len(inputs)] = Input(name=var_name, value=right.text.decode("ISO-8859-1"), scope=1, is_declared=0, type=base_type, span=(left.start_byte, right.end_byte))
+                    spans.append((left.start_byte, right.end_byte))
+            continue
+
+        stack.extend((child, local_types) for child in reversed(node.named_children))
+
+    pieces = []
+    last = 0
+    for i, (start, end) in enumerate(spans):
+        pieces.append(file_contents[last:start])
+        pieces.append(f"[INPUT_{i}]")
+        last = end
+    pieces.append(file_contents[last:])
+
+    return Test(name=name, file_pattern="".join(pieces), inputs=inputs)
@@ -1,125 +1,833 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import dataclasses
+import hashlib
+import json
+import math
 import os
+import re
+import shutil
+import sqlite3
 import subprocess
-from modules.test import FuzzedTest, Stats
+import tempfile
+import threading
+import time
+from modules.elf import object_sizes
+from modules.instructions import count_instructions
+from modules.process import AdaptiveTimeouts, can_limit, run
+from modules.telemetry import telemetry
+from modules.test import FuzzedTest, MutatedInputs, Stats, Test
+
+
+_EMPTY_PROGRAM = "int main(void) { return 0; }\n"
+_BATCH_DIAGNOSTIC = re.compile(r"^(?:In file included from )?(?P<name>m[0-9]+\.c):")
+
+
+@dataclasses.dataclass
+class CompileResult:
+    """Outcome of a single compilation."""
+
+    value: int
+    """Value of the metric: lines of assembly or bytes of code. 0 if the compilation failed."""
+
+    error: str | None = None
+    """Compiler error message, if any."""
+
+    functions: dict[str, int] | None = None
+    """Size in bytes of each function, only available with the size metric."""
+
+    timed_out: bool = False
+    """Whether the compilation timed out, in which case value is 0."""
+
+
+class CompileCache:
+    """Persistent content-addressed cache of compilation results.
+
+    Results are keyed by the identity of the compiler binary, the flags and the hash of the
+    source, and stored in a SQLite database so that every worker of the pool can share it.
+    When the cache grows over max_size bytes the least recently used entries are evicted.
+    Lookups only read the database: the last use of the entries hit is written in batches,
+    along with the next insertion or once TOUCH_BATCH entries were hit.
+    """
+
+    SCHEMA_VERSION = 2
+    EVICTION_BATCH = 64
+    CONNECT_RETRIES = 20
+    TOUCH_BATCH = 256
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+        self._identities = {}
+
+    def __getstate__(self):
+        # sqlite connections cannot be pickled nor shared between processes
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection to the database, opened lazily once per process and thread."""
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+            self._local.touched = {}
+        return self._local.connection
+
+    def _connect(self) -> sqlite3.Connection:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        connection = sqlite3.connect(self.path, timeout=60)
+
+        # the setup is not covered by the busy timeout, retry it while other workers are connecting
+        for attempt in range(self.CONNECT_RETRIES):
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+
+                with connection:
+                    if connection.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                        connection.execute("DROP TABLE IF EXISTS results")
+                        connection.execute("DROP TABLE IF EXISTS counters")
+                    connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value INTEGER NOT NULL, error TEXT, functions TEXT, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+                    connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+                    connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    connection.execute("INSERT OR IGNORE INTO counters VALUES ('size', 0)")
+                    connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                break
+            except sqlite3.OperationalError:
+                if attempt == self.CONNECT_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+
+        return connection
+
+    def _identity(self, compiler: str) -> str:
+        """The identity of a compiler binary: its resolved path, size and modification time."""
+        if compiler not in self._identities:
+            path = os.path.realpath(shutil.which(compiler) or compiler)
+            st = os.stat(path)
+            self._identities[compiler] = f"{path}:{st.st_size}:{st.st_mtime_ns}"
+        return self._identities[compiler]
+
+    def key(self, compiler: str, flags: list[str], content: str) -> str:
+        """Compute the cache key of a compilation.
+
+        Args:
+            compiler (str): the compiler used
+            flags (list[str]): the flags passed to the compiler
+            content (str): the source to compile
+
+        Returns:
+            str: the key of the compilation
+        """
+        h = hashlib.sha256()
+        h.update(self._identity(compiler).encode())
+        h.update(b"\0" + " ".join(flags).encode() + b"\0")
+        h.update(content.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> CompileResult | None:
+        """Look up a compilation result, None if it is not cached."""
+        row = self.connection.execute("SELECT value, error, functions FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        self._local.touched[key] = time.time()
+        if len(self._local.touched) >= self.TOUCH_BATCH:
+            with self.connection as connection:
+                self._write_touched(connection)
+
+        return CompileResult(value=row[0], error=row[1], functions=json.loads(row[2]) if row[2] else None)
+
+    def _write_touched(self, connection: sqlite3.Connection):
+        """Write the last use of the entries hit since the last write, in the transaction of the connection."""
+        if self._local.touched:
+            connection.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._local.touched.items()])
+            self._local.touched = {}
+
+    def put(self, key: str, result: CompileResult):
+        """Store a compilation result, evicting the least recently used entries if needed."""
+        functions = json.dumps(result.functions) if result.functions is not None else None
+        size = len(key) + len(result.error or "") + len(functions or "") + 16
+
+        with self.connection as connection:
+            # before the eviction, so that the entries hit meanwhile are not evicted
+            self._write_touched(connection)
+            inserted = connection.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?)", (key, result.value, result.error, functions, size, time.time())).rowcount
+            if not inserted:
+                return
+            connection.execute("UPDATE counters SET value = value + ? WHERE name = 'size'", (size,))
+
+            total = connection.execute("SELECT value FROM counters WHERE name = 'size'").fetchone()[0]
+            while total > self.max_size:
+                oldest = connection.execute("SELECT key, size FROM results ORDER BY last_used LIMIT ?", (self.EVICTION_BATCH,)).fetchall()
+                if not oldest:
+                    break
+                connection.executemany("DELETE FROM results WHERE key = ?", [(k,) for k, _ in oldest])
+                freed = sum(s for _, s in oldest)
+                connection.execute("UPDATE counters SET value = value - ? WHERE name = 'size'", (freed,))
+                total -= freed
+
+    def entries(self) -> int:
+        """The number of results in the cache."""
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+@dataclasses.dataclass
+class AsanVerdict:
+    """Outcome of the ASAN check of a test built with a compiler."""
+
+    safe: bool
+    """Whether the test ran without errors, or could not be tested."""
+
+    tested: bool
+    """Whether the test could be built with ASAN."""
+
+    error: str | None = None
+    """The error of the build or of the run, if any, or the timeout of the run."""
+
+    timed_out: bool = False
+    """Whether the build or the run timed out."""
+
+    def to_result(self) -> CompileResult:
+        """The verdict as a result of the compile cache, where it is stored."""
+        return CompileResult(value=int(self.safe) | int(self.tested) << 1 | int(self.timed_out) << 2, error=self.error)
+
+    @staticmethod
+    def from_result(result: CompileResult) -> "AsanVerdict":
+        return AsanVerdict(safe=bool(result.value & 1), tested=bool(result.value & 2), error=result.error, timed_out=bool(result.value & 4))
+
+
+def count_assembly_lines(lines) -> int:
+    """Count the lines of assembly that are neither comments nor directives.
+
+    Args:
+        lines (Iterable[str]): the lines of the assembly
+
+    Returns:
+        int: the number of lines
+    """
+    num_lines = 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#') or line.startswith('.'):
+            continue
+        num_lines += 1
+    return num_lines
+
+
+def _split_batch_errors(stderr: str) -> dict[str, str]:
+    """Split the diagnostics of a compilation with many inputs by input file.
+
+    Args:
+        stderr (str): the diagnostics of the compiler
+
+    Returns:
+        dict[str, str]: the diagnostics of each input file that has any
+    """
+    errors = {}
+    current = None
+    for line in stderr.splitlines(keepends=True):
+        if match := _BATCH_DIAGNOSTIC.match(line):
+            current = match.group("name")
+        if current is not None:
+            errors[current] = errors.get(current, "") + line
+    return errors
+
 
 class Compiler:
     """Compiles the tests with the current compiler and with the previous"""
 
+    MIN_TIMEOUT = 1.0
+    """Lower bound of the adaptive timeouts, in seconds."""
+
     def __init__(self, args: any):
         self.args = args
         self.FLAGS = args.flags
+        self.cache = CompileCache(args.cache, args.cache_size * 2**20) if args.cache else None
+        self._instructions_baseline = {}
+        # whether each compiler can build with ASAN, as probed when the toolchain was resolved
+        self._asan_capable = {compiler: capable for compiler, capable in getattr(args, "asan_support", {}).items() if not capable}
+        self.memory_limit = args.memory_limit * 2**20 if args.memory_limit else None
+        self._max_timeouts = {"compile": args.compile_timeout, "asan_compile": args.compile_timeout, "run": args.run_timeout}
+        self._timeouts = {kind: AdaptiveTimeouts(args.timeout_factor, self.MIN_TIMEOUT, maximum) for kind, maximum in self._max_timeouts.items()} if args.timeout_factor else None
+        # with the fixed timeouts the kill of the process group is enough, the limits cost a prlimit per command
+        self._limits = (self.memory_limit is not None or self._timeouts is not None) and can_limit()
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
         pass
 
-    def is_asan_safe(self, test: Stats, compiler: str) -> bool:
-        output_name = "tmp_asan_" + os.path.splitext(test.file_name)[0]
-        dir = os.path.join(os.path.dirname(test.file_path), output_name)
+    def __getstate__(self):
+        # the threads of the compilers of a process cannot be pickled nor shared with the workers
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_executor_pid"] = None
+        del state["_executor_lock"]
+        return state
 
-        while os.path.isfile(dir+".c"):
-            dir += "_"
-            output_name += "_"
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._executor_lock = threading.Lock()
 
-        output_dir = os.path.join(".tmp", output_name)
+    def __executor(self) -> ThreadPoolExecutor:
+        """The threads running the compilers of a mutant concurrently, created once per process."""
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.args.parallel_compilers, thread_name_prefix="compiler")
+                self._executor_pid = os.getpid()
+            return self._executor
 
-        with open(dir+".c", "w") as f:
-            f.write(test.file_content)
+    def __run(self, kind: str, command: list[str], seed: str, compiler: str, n: int = 1, **kwargs) -> subprocess.CompletedProcess:
+        """Runs a compiler or a sanitized binary with the timeout of the seed and the compiler, in a process group
+        of its own and with the resource limits, recording its latency for the adaptive timeouts
+
+        Arguments:
+            kind {str} -- 'compile', 'asan_compile' or 'run'
+            command {list[str]} -- The command to run
+            seed {str} -- The path of the seed the test comes from
+            compiler {str} -- The compiler used
+            n {int} -- The number of sources compiled by the command
+
+        Raises:
+            subprocess.TimeoutExpired: If the timeout expired, the process group is killed
+
+        Returns:
+            subprocess.CompletedProcess -- The outcome of the command
+        """
+
+        key, fallback = (kind, seed, compiler), (kind, compiler)
+        timeout = (self._timeouts[kind].timeout(key, fallback) if self._timeouts is not None else self._max_timeouts[kind]) * n
+        cpu_seconds, memory = None, None
+        if self._limits:
+            cpu_seconds = math.ceil(timeout) + 1
+            # the address space of a sanitized binary includes the shadow memory, its memory is capped by ASAN instead
+            memory = self.memory_limit if kind != "run" else None
+
+        start = time.perf_counter()
+        try:
+            return run(command, timeout=timeout, cpu_seconds=cpu_seconds, memory=memory, **kwargs)
+        finally:
+            if self._timeouts is not None:
+                self._timeouts[kind].observe(key, (time.perf_counter() - start) / n, fallback)
+
+    def __stdin_args(self, test) -> list[str]:
+        """The arguments to compile the content of the test from stdin. 
+        The directory of the test is added to the include path so that local headers are still found."""
+        return ["-x", "c", "-", "-iquote", os.path.dirname(test.file_path) or "."]
 
+    def is_asan_safe(self, test: Stats, compiler: str) -> bool:
+        """Checks with ASAN that the test built with the specified compiler runs without errors.
+        The verdicts are cached by the source, and by the sanitized binary since different sources may build the same one.
+        A compiler that cannot build with ASAN is not tried again, the test is then considered safe but not tested.
+
+        Arguments:
+            test {Stats} -- The stats object of the test, updated with whether it was tested and the error, if any
+            compiler {str} -- The compiler to use, 'last' for the current one
+
+        Returns:
+            bool -- Whether the test is ASAN safe
+        """
         if compiler == "last":
             compiler = self.args.compiler
 
-        result = subprocess.run([compiler, dir+".c", "-fsanitize=address", "-o", output_dir] + self.FLAGS, stderr=subprocess.PIPE)
+        if self._asan_capable.get(compiler) is False:
+            return self.__apply_verdict(test, AsanVerdict(safe=True, tested=False, error=f"{compiler} cannot build with -fsanitize=address"), compiler)
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(compiler, self.FLAGS + ["-fsanitize=address"], test.file_content)
+            cached = self.cache.get(key)
+            telemetry.count("asan_cache", "miss" if cached is None else "hit")
+            if cached is not None:
+                return self.__apply_verdict(test, AsanVerdict.from_result(cached), compiler)
+
+        verdict = self.__asan_check(test, compiler)
+        # a build that timed out is tried again, the timeout of a run is as cached as the other outcomes
+        if key is not None and (verdict.tested or not verdict.timed_out):
+            self.cache.put(key, verdict.to_result())
+        return self.__apply_verdict(test, verdict, compiler)
+
+    def __apply_verdict(self, test: Stats, verdict: "AsanVerdict", compiler: str) -> bool:
+        test.asan_tested = verdict.tested
+        if verdict.error is not None:
+            test.error_message = verdict.error
+        if verdict.timed_out:
+            test.add_timeout("asan " + compiler)
+        return verdict.safe
+
+    def __asan_check(self, test: Stats, compiler: str) -> "AsanVerdict":
+        """Builds the test with ASAN and runs it, unless the verdict of the same binary is cached."""
+
+        if self.args.pipe:
+            fd, output_dir = tempfile.mkstemp(prefix="tmp_asan_", dir=".tmp")
+            os.close(fd)
+            with telemetry.time("asan_compile", os.path.basename(compiler)):
+                result = self.__run_asan_compile([compiler] + self.__stdin_args(test) + ["-fsanitize=address", "-o", output_dir] + self.FLAGS, test, compiler, input=test.file_content.encode())
+        else:
+            # a name of its own, since the candidates of a seed may be validated concurrently
+            fd, source = tempfile.mkstemp(prefix="tmp_asan_" + os.path.splitext(test.file_name)[0] + "_", suffix=".c", dir=os.path.dirname(test.file_path) or ".")
+            output_dir = os.path.join(".tmp", os.path.splitext(os.path.basename(source))[0])
+
+            with os.fdopen(fd, "w") as f:
+                f.write(test.file_content)
+
+            with telemetry.time("asan_compile", os.path.basename(compiler)):
+                result = self.__run_asan_compile([compiler, source, "-fsanitize=address", "-o", output_dir] + self.FLAGS, test, compiler)
+            os.remove(source)
+
+        if result is None:
+            if os.path.isfile(output_dir):
+                os.remove(output_dir)
+            return AsanVerdict(safe=False, tested=False, error="Timeout expired while building with -fsanitize=address", timed_out=True)
+
         if result.stderr:
             # Could not compile with asan, probably a problem of the architecture
-            test.asan_tested = False
-            test.error_message = result.stderr.decode("utf-8")
-            return True
-        
-        os.remove(dir+".c")
+            if os.path.isfile(output_dir):
+                os.remove(output_dir)
+            if not self.__can_build_asan(test, compiler):
+                self._asan_capable[compiler] = False
+            return AsanVerdict(safe=True, tested=False, error=result.stderr.decode("utf-8"))
 
+        binary_key = None
         try:
-            result = subprocess.run(["./"+output_dir], stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=10)
+            if self.cache is not None:
+                # the name of the source is part of the binary, so only the sources piped on stdin can share it
+                with open(output_dir, "rb") as f:
+                    binary_key = hashlib.sha256(f"asan\0{self.args.pipe}\0".encode() + f.read()).hexdigest()
+                if (cached := self.cache.get(binary_key)) is not None:
+                    return AsanVerdict.from_result(cached)
+
+            try:
+                with telemetry.time("asan_run", os.path.basename(compiler)):
+                    result = self.__run("run", [os.path.abspath(output_dir)], test.file_path, compiler, stderr=subprocess.PIPE, stdout=subprocess.PIPE, env=self.__asan_env())
+                verdict = AsanVerdict(safe=not result.stderr, tested=True, error=result.stderr.decode("utf-8") if result.stderr else None)
+            except subprocess.TimeoutExpired:
+                telemetry.count("asan_timeout", os.path.basename(compiler))
+                verdict = AsanVerdict(safe=True, tested=True, error="Timeout expired, probably asan safe", timed_out=True)
+        finally:
+            os.remove(output_dir)
+
+        if binary_key is not None:
+            self.cache.put(binary_key, verdict.to_result())
+        return verdict
+
+    def __run_asan_compile(self, command: list[str], test: Stats, compiler: str, **kwargs) -> subprocess.CompletedProcess | None:
+        """Builds a test with ASAN, None if the build timed out."""
+        try:
+            return self.__run("asan_compile", command, test.file_path, compiler, stderr=subprocess.PIPE, **kwargs)
         except subprocess.TimeoutExpired:
-            test.error_message = "Timeout expired, probably asan safe"
-            # print("Timeout expired, probably asan safe")
-            pass
+            telemetry.count("asan_compile_timeout", os.path.basename(compiler))
+            return None
 
-        test.asan_tested = True
+    def __asan_env(self) -> dict[str, str] | None:
+        """The environment of the sanitized binaries, capping their resident memory if a memory limit is set."""
+        if self.memory_limit is None:
+            return None
+        options = os.environ.get("ASAN_OPTIONS", "")
+        return {**os.environ, "ASAN_OPTIONS": f"{options}:hard_rss_limit_mb={self.memory_limit // 2**20}".lstrip(":")}
 
-        if result.stderr:
-            # print(result.stderr.decode("utf-8"))
-            test.error_message = result.stderr.decode("utf-8")
-            os.remove(output_dir)
-            return False
-        
-        os.remove(output_dir)
+    def __can_build_asan(self, test: Stats, compiler: str) -> bool:
+        """Whether the compiler can build an empty program with ASAN and the flags in use, checked once per compiler."""
+        if compiler not in self._asan_capable:
+            fd, binary = tempfile.mkstemp(prefix="tmp_asan_probe_", dir=".tmp")
+            os.close(fd)
+            try:
+                result = self.__run_asan_compile([compiler] + self.__stdin_args(test) + ["-fsanitize=address", "-o", binary] + self.FLAGS, test, compiler, input=_EMPTY_PROGRAM.encode())
+                self._asan_capable[compiler] = result is not None and result.returncode == 0 and not result.stderr
+            finally:
+                os.remove(binary)
+        return self._asan_capable[compiler]
+
+    def count_instructions(self, test: Stats, compiler: str) -> int | None:
+        """
+        Counts the instructions executed by the test built with the specified compiler.
+        The instructions executed by an empty program, i.e. the startup of the process, are not counted.
+        The count is cached by the hash of the binary.
 
-        return True
+        Arguments:
+            test {Stats} -- The stats object of the test to run
+            compiler {str} -- The compiler to use, 'last' for the current one
+
+        Returns:
+            int | None -- The number of executed instructions, None if it could not be measured or the cap was reached
+        """
+
+        if compiler == "last":
+            compiler = self.args.compiler
 
+        if compiler not in self._instructions_baseline:
+            self._instructions_baseline[compiler] = self.__count_instructions(_EMPTY_PROGRAM, test, compiler)
+
+        count = self.__count_instructions(test.file_content, test, compiler)
+        baseline = self._instructions_baseline[compiler]
+        if count is None or baseline is None:
+            return None
+
+        return max(count - baseline, 0)
+
+    def __count_instructions(self, content: str, test: Stats, compiler: str) -> int | None:
+        """Builds the content with the compiler and counts the instructions it executes, None if it could not be measured."""
+
+        fd, binary = tempfile.mkstemp(prefix="tmp_exec_", dir=".tmp")
+        os.close(fd)
+        try:
+            try:
+                result = self.__run("compile", [compiler] + self.__stdin_args(test) + ["-o", binary] + self.FLAGS, test.file_path, compiler, input=content.encode(), stderr=subprocess.PIPE)
+            except subprocess.TimeoutExpired:
+                return None
+            if result.returncode != 0:
+                return None
+
+            key = None
+            if self.cache is not None:
+                with open(binary, "rb") as f:
+                    key = hashlib.sha256(f"instructions\0{self.args.instruction_cap}\0".encode() + f.read()).hexdigest()
+                if (cached := self.cache.get(key)) is not None:
+                    return cached.value if cached.error is None else None
+
+            try:
+                with telemetry.time("count_instructions", os.path.basename(compiler)):
+                    count, stopped = count_instructions(binary, self.args.instruction_cap, timeout=60)
+            except OSError:
+                return None
+
+            if key is not None:
+                self.cache.put(key, CompileResult(value=count, error="Instruction cap reached" if stopped else None))
+
+            return count if not stopped else None
+        finally:
+            os.remove(binary)
     
-    def __compile_with(self, test, compiler: str) -> int:
+    def __output_flag(self) -> str:
+        """The flag selecting the output of the compilation: assembly for the lines metric, object code for the size metric."""
+        return "-c" if self.args.metric == "size" else "-S"
+
+    def __output_extension(self) -> str:
+        return ".o" if self.args.metric == "size" else ".s"
+
+    def __measure(self, output: bytes) -> CompileResult:
+        """Measure the output of a compilation with the selected metric.
+
+        Arguments:
+            output {bytes} -- The assembly or the object code
+
+        Returns:
+            CompileResult -- The value of the metric
+        """
+        if self.args.metric == "size":
+            text_size, functions = object_sizes(output)
+            return CompileResult(value=text_size, functions=functions)
+
+        return CompileResult(value=count_assembly_lines(output.decode("utf-8", errors="ignore").splitlines()))
+
+    def __compile_with(self, test, compiler: str) -> CompileResult:
         """
-        Compiles a test with the specified version of the compiler into assembly
+        Compiles a test with the specified version of the compiler and measures the output,
+        looking up the result in the compile cache first
         
         Arguments:
             test {tuple} -- The stats object of the test to compile
             compiler {str} -- The compiler to use
 
         Returns:
-            int -- The number of lines of the assembly file
+            CompileResult -- The value of the metric, 0 if the compilation failed
         """
 
-        output_name = "tmp_" + os.path.splitext(test.file_name)[0]
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(compiler, self.FLAGS + [self.__output_flag()], test.file_content)
+            result = self.cache.get(key)
+            telemetry.count("compile_cache", "miss" if result is None else "hit")
+            if result is not None:
+                return result
+
+        with telemetry.time("compile", os.path.basename(compiler)):
+            result = self.__assemble(test, compiler)
+        if result is None:
+            # timeouts are not deterministic, do not cache them
+            telemetry.count("compile_timeout", os.path.basename(compiler))
+            return CompileResult(value=0, timed_out=True)
+
+        if key is not None:
+            self.cache.put(key, result)
+
+        return result
+
+    def __assemble(self, test, compiler: str) -> CompileResult | None:
+        """
+        Compiles a test with the specified version of the compiler into assembly or object code
+        
+        Arguments:
+            test {tuple} -- The stats object of the test to compile
+            compiler {str} -- The compiler to use
 
-        dir = os.path.join(os.path.dirname(test.file_path), output_name)
+        Returns:
+            CompileResult -- The value of the metric and the error, if any. None if the compilation timed out
+        """
 
-        while os.path.isfile(dir+".c"):
-            dir += "_"
-            output_name += "_"
+        if self.args.pipe:
+            return self.__assemble_from_pipe(test, compiler)
 
-        output_dir = os.path.join(".tmp", output_name)
+        # a name of its own, since the compilers of a test and the mutants of a generation may run concurrently
+        fd, source = tempfile.mkstemp(prefix="tmp_" + os.path.splitext(test.file_name)[0] + "_" + os.path.basename(compiler) + "_", suffix=".c", dir=os.path.dirname(test.file_path) or ".")
+        output_name = os.path.splitext(os.path.basename(source))[0]
+        output_file = os.path.join(".tmp", output_name) + self.__output_extension()
 
-        with open(dir+".c", "w") as f:
+        with os.fdopen(fd, "w") as f:
             f.write(test.file_content)
 
         try:
-            result = subprocess.run([compiler, dir+".c", "-S", "-o", output_dir+".s"] + self.FLAGS, stderr=subprocess.PIPE, timeout=5)
+            result = self.__run("compile", [compiler, source, self.__output_flag(), "-o", output_file] + self.FLAGS, test.file_path, compiler, stderr=subprocess.PIPE)
         except subprocess.TimeoutExpired:
-            os.remove(dir+".c")
+            os.remove(source)
 
             try:
-                os.remove(output_dir+".s")
+                os.remove(output_file)
             except OSError as e:
                 pass
             
-            return 0
+            return None
         
         
         if result.stderr:
-            with open(os.path.join("err", "err_"+output_name)+".c", "w") as f:
-                f.write(test.file_content)
-                f.write(result.stderr.decode("utf-8"))
-            os.remove(dir+".c")
-            return 0
+            error = result.stderr.decode("utf-8")
+            self.__write_error(test, output_name, error)
+            os.remove(source)
+            return CompileResult(value=0, error=error)
 
-        num_lines = 0
+        compile_result = CompileResult(value=0)
         try:
-            with open(output_dir+".s") as f:
-                  for line in f.readlines():
-                    line = line.strip()
-                    if line.startswith('#') or line.startswith('.'):
-                        continue  
-                    num_lines += 1
-
-        except (FileNotFoundError, OSError):
+            with open(output_file, "rb") as f:
+                compile_result = self.__measure(f.read())
+
+        except (FileNotFoundError, OSError, ValueError):
             pass
 
         try:
-            os.remove(output_dir+".s")
+            os.remove(output_file)
         except OSError as e:
            pass
 
-        os.remove(dir+".c")
-        return num_lines
+        os.remove(source)
+        return compile_result
+
+    def __assemble_from_pipe(self, test, compiler: str) -> CompileResult | None:
+        """
+        Compiles a test with the specified version of the compiler, sending the source on stdin and 
+        reading the assembly from stdout, without temporary files.
+        NOTE: the assembler cannot write object code on stdout, so with the size metric the object is written in .tmp
         
+        Arguments:
+            test {tuple} -- The stats object of the test to compile
+            compiler {str} -- The compiler to use
+
+        Returns:
+            CompileResult -- The value of the metric and the error, if any. None if the compilation timed out
+        """
+
+        output_file = "-"
+        if self.args.metric == "size":
+            fd, output_file = tempfile.mkstemp(prefix="tmp_", suffix=".o", dir=".tmp")
+            os.close(fd)
+
+        try:
+            result = self.__run("compile", [compiler] + self.__stdin_args(test) + [self.__output_flag(), "-o", output_file] + self.FLAGS, test.file_path, compiler, input=test.file_content.encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if result.stderr:
+                error = result.stderr.decode("utf-8")
+                self.__write_error(test, f"{os.path.splitext(test.file_name)[0]}_{os.path.basename(compiler)}", error)
+                return CompileResult(value=0, error=error)
+
+            if output_file == "-":
+                return self.__measure(result.stdout)
+
+            with open(output_file, "rb") as f:
+                return self.__measure(f.read())
+        except subprocess.TimeoutExpired:
+            return None
+        except ValueError:
+            return CompileResult(value=0)
+        finally:
+            if output_file != "-":
+                os.remove(output_file)
+
+    def __write_error(self, test, output_name: str, error: str):
+        """Save the content of a test that could not be compiled, along with the error, in the err folder."""
+        with open(os.path.join("err", "err_"+output_name)+".c", "w") as f:
+            f.write(test.file_content)
+            f.write(error)
+        
+
+    def __compile_with_all(self, compile) -> dict[str, any]:
+        """
+        Runs a compilation with the current compiler and with all the older ones.
+        If more than one parallel compiler is allowed, the compilers run concurrently on the threads of the process,
+        shared by the mutants compiled at the same time.
+
+        Arguments:
+            compile {Callable[[str], any]} -- The compilation to run, given the compiler
+
+        Returns:
+            dict[str, any] -- The result of the compilation for each compiler, the current one under the key 'last'
+        """
+
+        compilers = {"last": self.args.compiler, **{i: i for i in self.args.older_compilers}}
+
+        if self.args.parallel_compilers <= 1:
+            return {name: compile(compiler) for name, compiler in compilers.items()}
+
+        results = {}
+        executor = self.__executor()
+        futures = {executor.submit(compile, compiler): name for name, compiler in compilers.items()}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+        return results
+
+    def __set_compiler_stats(self, stats: Stats, results: dict[str, CompileResult]):
+        """Add the results of the compilers to the stats, skipping the older compilers that failed."""
+        stats.add_compiler_stat("last", results["last"].value, results["last"].functions)
+        if results["last"].timed_out:
+            stats.add_timeout(self.args.compiler)
+
+        for i in self.args.older_compilers:
+            n = results[i].value
+            if results[i].timed_out:
+                stats.add_timeout(i)
+
+            if n == 0:
+                continue
+            
+            stats.add_compiler_stat(i, n, results[i].functions)
+        
+        stats.set_max() # Used to set the max_rateo variable
+
+    def compile_stats(self, stats: Stats, older_compiler: str):
+        """Compiles the content of a stats object with the current compiler and with one of the older ones,
+        setting its compiler stats and max rateo
+
+        Arguments:
+            stats {Stats} -- The stats object of the content to compile
+            older_compiler {str} -- The older compiler to compare with
+        """
+
+        last = self.__compile_with(stats, self.args.compiler)
+        stats.add_compiler_stat("last", last.value, last.functions)
+        if last.timed_out:
+            stats.add_timeout(self.args.compiler)
+
+        older = self.__compile_with(stats, older_compiler)
+        if older.timed_out:
+            stats.add_timeout(older_compiler)
+        if older.value != 0:
+            stats.add_compiler_stat(older_compiler, older.value, older.functions)
+
+        stats.set_max()
+
+    def compile_batch(self, test: Test, contents: list[str], compiler: str) -> list[int]:
+        """
+        Compiles many contents of the same test with a single invocation of the compiler.
+        A content that does not compile only affects its own result.
+
+        Arguments:
+            test {Test} -- The test the contents are generated from
+            contents {list[str]} -- The contents to compile
+            compiler {str} -- The compiler to use
+
+        Returns:
+            list[int] -- The value of the metric for each content, 0 if it could not be compiled
+        """
+
+        return [result.value for result in self.__compile_batch(test, contents, compiler)]
+
+    def __compile_batch(self, test: Test, contents: list[str], compiler: str) -> list[CompileResult]:
+        """
+        Compiles many contents of the same test with a single invocation of the compiler,
+        looking up the results in the compile cache first
+
+        Arguments:
+            test {Test} -- The test the contents are generated from
+            contents {list[str]} -- The contents to compile
+            compiler {str} -- The compiler to use
+
+        Returns:
+            list[CompileResult] -- The result of each content, with value 0 if it could not be compiled
+        """
+
+        results = [None] * len(contents)
+        keys = [None] * len(contents)
+        if self.cache is not None:
+            for i, content in enumerate(contents):
+                keys[i] = self.cache.key(compiler, self.FLAGS + [self.__output_flag()], content)
+                results[i] = self.cache.get(keys[i])
+                telemetry.count("compile_cache", "miss" if results[i] is None else "hit")
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            with telemetry.time("compile_batch", os.path.basename(compiler)):
+                compiled = self.__assemble_batch(test, [contents[i] for i in missing], compiler)
+            for i, result in zip(missing, compiled):
+                if result is None:
+                    continue
+                results[i] = result
+                if keys[i] is not None:
+                    self.cache.put(keys[i], result)
+
+        return [result if result is not None else CompileResult(value=0, timed_out=True) for result in results]
+
+    def __assemble_batch(self, test: Test, contents: list[str], compiler: str) -> list[CompileResult | None]:
+        """
+        Compiles many contents into assembly or object code with a single invocation of the compiler.
+        If the invocation times out, the contents are compiled one by one.
+
+        Arguments:
+            test {Test} -- The test the contents are generated from
+            contents {list[str]} -- The contents to compile
+            compiler {str} -- The compiler to use
+
+        Returns:
+            list[CompileResult | None] -- The result of each content, None if its compilation timed out
+        """
+
+        batch_dir = tempfile.mkdtemp(prefix="tmp_batch_", dir=".tmp")
+        try:
+            names = [f"m{i}.c" for i in range(len(contents))]
+            for name, content in zip(names, contents):
+                with open(os.path.join(batch_dir, name), "w") as f:
+                    f.write(content)
+
+            try:
+                result = self.__run("compile", [compiler, self.__output_flag(), "-iquote", os.path.abspath(os.path.dirname(test.name))] + self.FLAGS + names, 
+                                    test.name, compiler, n=len(contents), cwd=batch_dir, stderr=subprocess.PIPE)
+            except subprocess.TimeoutExpired:
+                return [self.__assemble(Stats(file_path=test.name, file_name=os.path.basename(test.name), file_content=content), compiler) for content in contents]
+
+            errors = _split_batch_errors(result.stderr.decode("utf-8"))
+
+            results = []
+            for i, (name, content) in enumerate(zip(names, contents)):
+                if name in errors:
+                    self.__write_error(Stats(file_path=test.name, file_name=os.path.basename(test.name), file_content=content), 
+                                       f"{os.path.splitext(os.path.basename(test.name))[0]}_{os.path.basename(compiler)}_{i}", errors[name])
+                    results.append(CompileResult(value=0, error=errors[name]))
+                    continue
+
+                try:
+                    with open(os.path.join(batch_dir, os.path.splitext(name)[0] + self.__output_extension()), "rb") as f:
+                        results.append(self.__measure(f.read()))
+                except (OSError, ValueError):
+                    results.append(CompileResult(value=0, error=result.stderr.decode("utf-8")))
+
+            return results
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
 
     def compile_test(self, tuple) -> FuzzedTest:
         """Compiles a test with the current compiler and with the previous
@@ -139,16 +847,35 @@ class Compiler:
             raise FileNotFoundError("File " + test + " does not exist")
         
         stats = Stats(file_path=test.name, file_name=os.path.basename(test.name), file_content=f_content)
-        stats.add_compiler_stat("last", self.__compile_with(stats, self.args.compiler))
+        self.__set_compiler_stats(stats, self.__compile_with_all(lambda compiler: self.__compile_with(stats, compiler)))
 
-        for i in self.args.older_compilers:
-            n = self.__compile_with(stats, i)
+        return FuzzedTest(test=test, stats=stats, mutated_inputs=new_inputs)
 
-            if n == 0:
-                continue
-            
-            stats.add_compiler_stat(i, n)
+    def compile_test_batch(self, test: Test, mutants: list[tuple[str, MutatedInputs]]) -> list[FuzzedTest]:
+        """Compiles many mutants of a test with the current compiler and with the previous,
+        using a single invocation of each compiler
         
-        stats.set_max() # Used to set the max_rateo variable
+        Arguments:
+            test {Test} -- The test object the mutants are generated from
+            mutants {list[tuple]} -- The content and the inputs of each mutant
+        
+        Raises:
+            FileNotFoundError: If the test does not exist
 
-        return FuzzedTest(test=test, stats=stats, mutated_inputs=new_inputs)
+        Returns:
+            list[FuzzedTest] -- The fuzzed tests
+        """
+
+        if not os.path.isfile(test.name):
+            raise FileNotFoundError("File " + test.name + " does not exist")
+
+        contents = [content for content, _ in mutants]
+        results = self.__compile_with_all(lambda compiler: self.__compile_batch(test, contents, compiler))
+
+        fuzzed_tests = []
+        for i, (content, inputs) in enumerate(mutants):
+            stats = Stats(file_path=test.name, file_name=os.path.basename(test.name), file_content=content)
+            self.__set_compiler_stats(stats, {name: compiled[i] for name, compiled in results.items()})
+            fuzzed_tests.append(FuzzedTest(test=test, stats=stats, mutated_inputs=inputs))
+
+        return fuzzed_tests
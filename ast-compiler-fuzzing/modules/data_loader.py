@@ -1,10 +1,17 @@
 from pathlib import Path
 import re
 import difflib
+import hashlib
+import io
+import multiprocessing as mp
 import os
-import platform
+import pickle
+import shutil
+import subprocess
 
-from modules.test import Input, Test, Stats
+from modules.results import ResultsStore, finding_record, write_legacy, write_reduced
+from modules.telemetry import telemetry
+from modules.test import Input, Template, Test, Stats
 
 
 _PATTERN_EXEC = r"int\s+main\s*\("
@@ -15,16 +22,25 @@ _PATTERN_CONSTANTS_GLOBAL_DEF = rf"^(:?\w+\b(?<!\btypedef)\s+)?(?P<type>int|floa
 _PATTERN_CONSTANTS_GLOBAL_ASS = rf"^(?P<seq>(?:\s+(?P<is_pointer>\*)?(?P<name>\w+)(?P<is_array>\[(?P<size>[0-9]*)\])?\s*(?:=\s*{_VALUE_PATTERN}?(?:,|;))+)"
 _PATTERN_CONSTANTS_GLOBAL_SEQ = rf"(?P<initial_space>\s*)(?P<input>(?P<is_pointer>\*)?(?P<name>\w+)(?P<is_array>\[(?P<size>[0-9]*)\])?\s*(?:=\s*{_VALUE_PATTERN}?)(?P<has_next>,|;)(?P<final_space>\s*)"
 _POSSIBLE_MATCHES = [(re.compile(pattern), is_global, is_declared)  for pattern, is_global, is_declared in ((_PATTERN_CONSTANTS_LOCAL_DEF, 1, 1), (_PATTERN_CONSTANTS_LOCAL_ASS, 1, 0), (_PATTERN_CONSTANTS_GLOBAL_DEF, 0, 1), (_PATTERN_CONSTANTS_GLOBAL_ASS, 0, 0))]
+_R_GLOBAL_SEQ = re.compile(_PATTERN_CONSTANTS_GLOBAL_SEQ, re.MULTILINE)
+_R_STRUCT = re.compile(r".*struct.*")
+_R_UNION = re.compile(r".*union.*")
+_R_CLOSE_BRACE = re.compile(r"^}.*")
+_R_OPEN_PAREN = re.compile(r".*\(.*")
+_R_CLOSE_PAREN = re.compile(r".*\).*")
 _FILE_EXTENSION = '**/*.[c cpp]'
 
 
 class DataLoader:
     """Class for importing and preprocessing tests."""
     
+    INDEX_VERSION = 3
+    
     def __init__(self, args):
         # Constructor code goes here
         self.args = args
-        pass
+        self._results: ResultsStore | None = None
+        self._used_names: set[str] | None = None
     
     def tests(self) -> list[Test]:
         """Collect the processed tests from the given directory.
@@ -36,23 +52,155 @@ class DataLoader:
         directory = self.args.input
         print(f"Analyzing tests in {directory}")
         test_directory = Path(directory)
-        executable_tests = [test_file for test_file in test_directory.glob(_FILE_EXTENSION) if self._is_executable(test_file)]
-        tests = [self._promote_constants_to_variables(test_file) for test_file in  executable_tests]
+        files = sorted(str(test_file) for test_file in test_directory.glob(_FILE_EXTENSION))
+
+        index = self._load_index()
+        entries = {}
+        changed = []
+        for file in files:
+            st = os.stat(file)
+            entry = index["tests"].get(file)
+            if entry is not None and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                entries[file] = entry
+            else:
+                changed.append((file, st.st_mtime_ns, st.st_size, entry["hash"] if entry is not None else None, entry["test"] if entry is not None else None))
+
+        if changed:
+            if len(changed) > 1 and self.args.num_cores > 1:
+                with mp.Pool(min(self.args.num_cores, len(changed))) as pool:
+                    analyzed = pool.map(self._analyze, changed, chunksize=max(1, len(changed) // (4 * self.args.num_cores)))
+            else:
+                analyzed = [self._analyze(item) for item in changed]
+            for entry in analyzed:
+                entries[entry["path"]] = entry
+            print(f"Analyzed {len(changed)} new or modified files, {len(files) - len(changed)} loaded from the index")
+
+        tests = [entries[file]["test"] for file in files if entries[file]["test"] is not None]
+
+        preprocessed_index = {}
+        if self.args.preprocess:
+            toolchain = self._toolchain_key()
+            preprocessed = []
+            for test in tests:
+                if not test.has_valid_inputs():
+                    preprocessed.append(test)
+                    continue
+                key = (toolchain, hashlib.sha256(test.file_pattern.encode()).hexdigest())
+                if key not in index["preprocessed"]:
+                    expanded = self._preprocess(test)
+                    index["preprocessed"][key] = expanded.file_pattern if expanded is not test else None
+                preprocessed_index[key] = index["preprocessed"][key]
+                preprocessed.append(Test(name=test.name, file_pattern=preprocessed_index[key], inputs=test.inputs) if preprocessed_index[key] is not None else test)
+            print(f"Preprocessed {sum(p is not t for p, t in zip(preprocessed, tests))} tests")
+            tests = preprocessed
+
+        # files that disappeared and expansions by other toolchains are dropped
+        if changed or preprocessed_index.keys() != index["preprocessed"].keys():
+            self._write_index({"version": self.INDEX_VERSION, "extractor": self.args.extractor, "tests": entries, "preprocessed": preprocessed_index})
         return tests
+
+    def _analyze(self, item: tuple[str, int, int, str | None, Test | None]) -> dict:
+        """Analyze a new or modified file, reading it once.
+
+        Args:
+            item (tuple): the path, modification time and size of the file, and the hash and test of its index entry, if any.
+
+        Returns:
+            dict: the index entry of the file, whose test is None if the file is not an executable test.
+        """
+        file, mtime, size, old_hash, old_test = item
+        with open(file, "rb") as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        # touched but unchanged
+        if content_hash == old_hash:
+            return {"path": file, "mtime": mtime, "size": size, "hash": content_hash, "test": old_test}
+
+        # same decoding as a file opened in text mode, newlines included
+        content = data.decode("ISO-8859-1", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+        test = None
+        if self._is_executable(content):
+            if self.args.extractor == "ast":
+                # imported here since tree-sitter is only needed by the ast extractor
+                from modules.ast_extractor import extract
+                test = extract(file, content)
+            else:
+                test = self._promote_constants_to_variables(Path(file), content)
+        return {"path": file, "mtime": mtime, "size": size, "hash": content_hash, "test": test}
+
+    def _toolchain_key(self) -> str:
+        """The identity of the compilers and flags used to preprocess the tests."""
+        identities = []
+        for compiler in [self.args.compiler] + self.args.older_compilers:
+            path = os.path.realpath(shutil.which(compiler) or compiler)
+            st = os.stat(path)
+            identities.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+        return "\0".join(identities + self.args.flags)
+
+    def _load_index(self) -> dict:
+        """Load the index of the analyzed tests, an empty one if missing, outdated or disabled."""
+        empty = {"version": self.INDEX_VERSION, "extractor": self.args.extractor, "tests": {}, "preprocessed": {}}
+        if not self.args.test_index:
+            return empty
+        try:
+            with open(self.args.test_index, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return empty
+        return index if index.get("version") == self.INDEX_VERSION and index.get("extractor") == self.args.extractor else empty
+
+    def _write_index(self, index: dict):
+        """Write the index of the analyzed tests atomically."""
+        if not self.args.test_index:
+            return
+        if os.path.dirname(self.args.test_index):
+            os.makedirs(os.path.dirname(self.args.test_index), exist_ok=True)
+        tmp_path = f"{self.args.test_index}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.args.test_index)
+
+    def _preprocess(self, test: Test) -> Test:
+        """Expand the headers of the test once, so that the mutants do not go through the preprocessor again.
+        The placeholders of the inputs are preserved in the expanded pattern.
+        NOTE: the raw pattern is kept if the expansion differs across the compilers or loses some placeholder.
+
+        Args:
+            test (Test): the processed test.
+
+        Returns:
+            Test: the test with the expanded pattern.
+        """
+
+        expanded = None
+        for compiler in [self.args.compiler] + self.args.older_compilers:
+            try:
+                result = subprocess.run([compiler, "-E", "-P", "-x", "c", "-", "-iquote", os.path.dirname(test.name) or "."] + self.args.flags,
+                                        input=test.file_pattern.encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+            except subprocess.TimeoutExpired:
+                return test
+
+            if result.returncode != 0 or (expanded is not None and result.stdout.decode("utf-8", errors="ignore") != expanded):
+                return test
+            expanded = result.stdout.decode("utf-8", errors="ignore")
+
+        template = Template(expanded)
+        if sorted(template.slots) != sorted(test.template.slots):
+            return test
+
+        return Test(name=test.name, file_pattern=expanded, inputs=test.inputs, template=template)
     
-    def _is_executable(self, file: Path) -> bool:
+    def _is_executable(self, file_contents: str) -> bool:
         """Check if the file is executable.
         NOTE: we filter out files that are too big.
 
         Args:
-            file (Path): path to the file.
+            file_contents (str): content of the file.
 
         Returns:
             bool: whether the file is executable.
         """        
-        
-        with file.open(encoding="ISO-8859-1", errors='ignore') as f:
-            file_contents = f.read()
 
         if len(file_contents.splitlines()) > 200:
             return False
@@ -60,24 +208,22 @@ class DataLoader:
         match = re.search(_PATTERN_EXEC, file_contents)
         return True if match else False
     
-    def _promote_constants_to_variables(self, file: Path) -> Test:
+    def _promote_constants_to_variables(self, file: Path, file_contents: str) -> Test:
         """Promote constants to variables in the given file.
 
         Args:
             file (Path): path to the file.
-            to_directory (str): directory to save the modified file.
+            file_contents (str): content of the file.
 
         Returns:
             Test: the processed test.
         """       
         # modify the file to promote constants to variables and save it to a new file
-              
-        r_global_seq = re.compile(_PATTERN_CONSTANTS_GLOBAL_SEQ, re.MULTILINE)
-        
+
         inputs = {}
-        processed_file = ""
+        processed_lines = []
         
-        with file.open(encoding="ISO-8859-1", errors='ignore') as f:
+        with io.StringIO(file_contents) as f:
             in_struct = False
             in_union = False
             in_args = False
@@ -86,19 +232,19 @@ class DataLoader:
                 match_line = None
                 
                 # ------------ skip structs, unions and args in functions ------------ #
-                if  re.compile(r".*struct.*").match(original_line) :
+                if _R_STRUCT.match(original_line) :
                     in_struct = True
-                if  re.compile(r"^}.*").match(original_line) and in_struct:
+                if _R_CLOSE_BRACE.match(original_line) and in_struct:
                     in_struct = False
                 
-                if  re.compile(r".*union.*").match(original_line) :
+                if _R_UNION.match(original_line) :
                     in_union = True
-                if  re.compile(r"^}.*").match(original_line) and in_union:
+                if _R_CLOSE_BRACE.match(original_line) and in_union:
                     in_union = False
                 
-                if  re.compile(r".*\(.*").match(original_line) :
+                if _R_OPEN_PAREN.match(original_line) :
                     in_args = True
-                if  re.compile(r".*\).*").match(original_line) and in_args :
+                if _R_CLOSE_PAREN.match(original_line) and in_args :
                     in_args = False
                 
 
@@ -106,7 +252,7 @@ class DataLoader:
                     if not in_struct and not in_union and not in_args and (match_line  := pattern.match(original_line)) :
                         processed_line = original_line
                         
-                        for match in r_global_seq.finditer(match_line.group('seq')):
+                        for match in _R_GLOBAL_SEQ.finditer(match_line.group('seq')):
                             
                             # ----- skip pointers ----- #
                             if match.group('is_pointer'):
@@ -120,30 +266,61 @@ class DataLoader:
                                                 scope=scope,
                                                 is_declared=is_declared
                                             ) 
-                            processed_line = re.sub(_PATTERN_CONSTANTS_GLOBAL_SEQ, rf"\g<initial_space>[INPUT_{n_input}]\g<has_next>\g<final_space>", processed_line, count=1)
+                            processed_line = _R_GLOBAL_SEQ.sub(rf"\g<initial_space>[INPUT_{n_input}]\g<has_next>\g<final_space>", processed_line, count=1)
                             n_input += 1
                             
-                        processed_file += processed_line
+                        processed_lines.append(processed_line)
                         break
                     
                 if not match_line:
-                    processed_file += original_line
+                    processed_lines.append(original_line)
                     
-        return Test(name=str(file), file_pattern=processed_file, inputs=inputs)
+        return Test(name=str(file), file_pattern="".join(processed_lines), inputs=inputs)
     
     def save_results(self, s: Stats):
         """Save the results of the interesting tests to a file."""
 
+        with telemetry.time("save_results"):
+            self._save_results(s)
+
+    def _save_results(self, s: Stats):
+
         # with open(s.file_path, "r") as f:
         #     file_c = f.read()
         # diff = difflib.ndiff(s.file_content.splitlines(keepends=True), file_c.splitlines(keepends=True))
 
-        output_dir = os.path.join(self.args.output, os.path.splitext(s.file_name)[0]) + ".txt"
-        while os.path.isfile(output_dir):
-            output_dir += "_"
-        
-        csv_line = f"{s.file_path},{self.args.compiler},{s.max_rateo[1]},{s.compiler_stats['last']},{s.compiler_stats[s.max_rateo[1]]},{s.max_rateo[0]},{s.strategy_mutation},{'ASAN tested' if s.asan_tested else 'ASAN could not be tested'},{s.error_message}\n"
-        with open(output_dir, "w") as f:
-            f.writelines(csv_line)
-            f.writelines("Flags: " + " ".join(self.args.flags) + f" - Compiled for {platform.system()} - {platform.machine()}\n")
-            f.writelines(s.file_content.splitlines(keepends=True))
\ No newline at end of file
+        record = finding_record(s, self.args.compiler, self.args.flags)
+        if self.args.results_db:
+            # opened on the first result, since only the main process saves them
+            if self._results is None:
+                self._results = ResultsStore(self.args.results_db)
+            self._results.add(record)
+            return
+
+        # list the output directory once instead of probing the file system for a free name
+        if self._used_names is None:
+            self._used_names = set(os.listdir(self.args.output))
+        write_legacy(record, self.args.output, self._used_names)
+
+    def save_reduced(self, s: Stats, reduced: Stats) -> str:
+        """Save the reduced content of an interesting test in the reduced folder of the output directory,
+        or next to the test in the results database.
+
+        Args:
+            s (Stats): the stats of the interesting test
+            reduced (Stats): the stats of the reduced test
+
+        Returns:
+            str: the path of the written file, or of the results database
+        """
+
+        record = finding_record(s, self.args.compiler, self.args.flags)
+        record["reduced"] = reduced.file_content
+        record["reduced_ratio"] = reduced.max_rateo[0]
+        if self.args.results_db:
+            if self._results is None:
+                self._results = ResultsStore(self.args.results_db)
+            self._results.set_reduced(record)
+            return self.args.results_db
+
+        return write_reduced(record, self.args.output)
@@ -0,0 +1,307 @@
+import dataclasses
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Connection, Listener
+from tqdm import tqdm
+from modules.fuzzer import Fuzzer, _fuzz_seed, _init_worker
+from modules.seed_scheduler import SeedScheduler
+from modules.telemetry import telemetry
+from modules.test import Stats
+
+
+def parse_address(address: str) -> tuple[str, int] | str:
+    """The address of the coordinator: host:port for TCP, otherwise the path of a Unix socket."""
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host or "localhost", int(port)
+    return address
+
+
+@dataclasses.dataclass
+class Lease:
+    """A seed handed out to a node, until its result arrives or the lease expires."""
+
+    index: int
+    """Index of the seed in the tests of the coordinator."""
+
+    node: "_Node"
+    """The node running the seed."""
+
+    deadline: float
+    """Monotonic time after which the seed is scheduled again, unless the node sends a heartbeat."""
+
+
+class _Node:
+    """A node connected to the coordinator. Only the main thread of the coordinator sends to it."""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.name = None
+        self.seeds: set[int] = set()
+        """The seeds of the coordinator the node has."""
+        self.requested = 0
+        """The seeds the node asked for and did not receive yet."""
+
+    def send(self, message: tuple):
+        try:
+            self.connection.send(message)
+        except OSError:
+            # the reader thread reports the disconnection
+            pass
+
+
+class Coordinator:
+    """Owns the seed queue of a campaign running on many nodes and leases the seeds to them over TCP or a Unix socket.
+
+    The nodes run the single seed fuzzing of the fuzzer on their own cores and send back the results and a heartbeat
+    every third of the lease time. A lease without heartbeat for `lease_seconds`, or whose node disconnects, is
+    scheduled again. The coordinator is the only writer of the results, the journal and the telemetry of the campaign.
+    """
+
+    def __init__(self, fuzzer: Fuzzer, address: str, authkey: bytes, lease_seconds: float = 300):
+        self.fuzzer = fuzzer
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.lease_seconds = lease_seconds
+        self._events = queue.Queue()
+        self._closing = threading.Event()
+
+    def _accept(self, listener: Listener):
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, mp.AuthenticationError):
+                if self._closing.is_set():
+                    return
+                # e.g. a client with the wrong key
+                continue
+            node = _Node(connection)
+            threading.Thread(target=self._read, args=(node,), daemon=True).start()
+
+    def _read(self, node: _Node):
+        try:
+            while True:
+                self._events.put((node, node.connection.recv()))
+        except (EOFError, OSError):
+            self._events.put((node, ("closed",)))
+
+    def serve(self, loaded_interesting_tests: list[Stats]) -> list[Stats]:
+        """
+        Lease the seeds to the nodes until the threshold is reached or every seed is found or retired.
+
+        Args:
+            loaded_interesting_tests (list[Stats]): the interesting tests found by a previous run
+
+        Returns:
+            list[Stats]: the interesting tests found by the nodes
+        """
+
+        fuzzer = self.fuzzer
+        n_file_found = len(loaded_interesting_tests)
+        loaded_names = {stat.file_path for stat in loaded_interesting_tests}
+        seeds = [i for i, test in enumerate(fuzzer.tests) if test.has_valid_inputs() and test.name not in loaded_names]
+        indexes = {fuzzer.tests[i].name: i for i in seeds}
+
+        interesting_tests: list[Stats] = []
+        scheduler = SeedScheduler(seeds, energy=fuzzer.seed_scheduler == "energy")
+        scheduler.restore({index: fuzzer.progress[fuzzer.tests[index].name] for index in seeds if fuzzer.tests[index].name in fuzzer.progress})
+
+        leases: dict[int, Lease] = {}
+        lease_ids = itertools.count()
+        nodes: list[_Node] = []
+        # the seeds that no connected node has, scheduled again when a node having them joins
+        parked: set[int] = set()
+
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+        print(f"Coordinating {len(seeds)} tests on {listener.address}. Threshold: {fuzzer.n_threshold}")
+        pbar = tqdm(total=fuzzer.n_threshold, initial=n_file_found)
+
+        try:
+            while n_file_found < fuzzer.n_threshold:
+                try:
+                    node, message = self._events.get(timeout=1)
+                except queue.Empty:
+                    node, message = None, ("tick",)
+
+                now = time.monotonic()
+                for lease_id, lease in list(leases.items()):
+                    if lease.deadline < now:
+                        del leases[lease_id]
+                        scheduler.requeue(lease.index)
+                        telemetry.count("leases", "expired")
+
+                kind = message[0]
+                if kind == "hello":
+                    _, node.name, names = message
+                    node.seeds = {indexes[name] for name in names if name in indexes}
+                    nodes.append(node)
+                    for index in parked & node.seeds:
+                        scheduler.requeue(index)
+                    parked -= node.seeds
+                    print(f"Node {node.name} joined with {len(node.seeds)} tests")
+
+                elif kind == "request":
+                    node.requested += message[1]
+
+                elif kind == "heartbeat":
+                    for lease in leases.values():
+                        if lease.node is node:
+                            lease.deadline = now + self.lease_seconds
+
+                elif kind == "result":
+                    _, lease_id, name, result = message
+                    lease = leases.pop(lease_id, None)
+                    index = indexes[name]
+                    result = dataclasses.replace(result, index=index)
+                    telemetry.merge(result.telemetry)
+                    telemetry.count("seeds", "done")
+                    if fuzzer.telemetry_writer is not None:
+                        fuzzer.telemetry_writer.write(telemetry)
+
+                    if index in scheduler.found:
+                        pass
+                    elif result.stats is not None:
+                        # kept even if the lease expired meanwhile, the seed is not leased again
+                        fuzzer._save_found(scheduler, index, result.stats)
+                        pbar.update()
+                        n_file_found += 1
+                        pbar.set_description(f"Found new mutation: {result.stats.file_path} with {result.stats.max_rateo[0]}")
+                        interesting_tests.append(result.stats)
+                    elif lease is not None:
+                        fuzzer._finish_run(scheduler, result)
+
+                elif kind == "closed":
+                    if node in nodes:
+                        nodes.remove(node)
+                        print(f"Node {node.name} left")
+                    for lease_id, lease in list(leases.items()):
+                        if lease.node is node:
+                            del leases[lease_id]
+                            scheduler.requeue(lease.index)
+                            telemetry.count("leases", "released")
+
+                # hand out the seeds to the nodes that asked for them
+                for node in nodes:
+                    skipped = []
+                    while node.requested > 0 and (task := scheduler.next()) is not None:
+                        index, n_iterations = task
+                        if index in scheduler.found:
+                            continue
+                        if index not in node.seeds:
+                            if any(index in other.seeds for other in nodes):
+                                skipped.append(index)
+                            else:
+                                parked.add(index)
+                            continue
+                        lease_id = next(lease_ids)
+                        leases[lease_id] = Lease(index=index, node=node, deadline=now + self.lease_seconds)
+                        progress = fuzzer.progress.get(fuzzer.tests[index].name)
+                        inputs = progress.best_inputs if progress is not None else None
+                        node.send(("lease", lease_id, fuzzer.tests[index].name, random.getrandbits(64), n_iterations, inputs))
+                        node.requested -= 1
+                        telemetry.count("leases", "granted")
+                    for index in skipped:
+                        scheduler.requeue(index)
+
+                if not leases and len(scheduler) == 0:
+                    if parked:
+                        print(f"Every test is found or retired, except {len(parked)} that no connected node has")
+                    else:
+                        print("Every test is found or retired")
+                    break
+
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            traceback.print_exc()
+        finally:
+            pbar.close()
+            for node in nodes:
+                node.send(("stop",))
+            self._closing.set()
+            listener.close()
+            if fuzzer.telemetry_writer is not None:
+                fuzzer.telemetry_writer.write(telemetry, force=True)
+            return interesting_tests
+
+
+def run_node(fuzzer: Fuzzer, address: str, authkey: bytes, lease_seconds: float = 300):
+    """
+    Fuzz the seeds leased by a coordinator on the cores of this node, until the coordinator stops it.
+    The node must see the tests at the same paths as the coordinator, e.g. on a shared file system.
+
+    Args:
+        fuzzer (Fuzzer): the fuzzer of the node, whose tests are the ones the node can run
+        address (str): the address of the coordinator, host:port or the path of a Unix socket
+        authkey (bytes): the key authenticating the node to the coordinator
+        lease_seconds (float): the lease time of the coordinator, a heartbeat is sent every third of it
+    """
+
+    connection = Client(parse_address(address), authkey=authkey)
+    lock = threading.Lock()
+    stopped = threading.Event()
+    events = queue.Queue()
+
+    def send(message: tuple):
+        with lock:
+            connection.send(message)
+
+    def read():
+        try:
+            while True:
+                events.put(connection.recv())
+        except (EOFError, OSError):
+            events.put(("stop",))
+
+    def heartbeat():
+        while not stopped.wait(lease_seconds / 3):
+            try:
+                send(("heartbeat",))
+            except OSError:
+                return
+
+    indexes = {test.name: i for i, test in enumerate(fuzzer.tests) if test.has_valid_inputs()}
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    send(("hello", name, list(indexes)))
+    threading.Thread(target=read, daemon=True).start()
+    threading.Thread(target=heartbeat, daemon=True).start()
+    print(f"Node {name} fuzzing {len(indexes)} tests with {fuzzer.num_cores} cores for {address}")
+
+    runs = 0
+    try:
+        with mp.Pool(fuzzer.num_cores, initializer=_init_worker, initargs=(fuzzer,)) as pool:
+            send(("request", 2 * fuzzer.num_cores))
+            while True:
+                message = events.get()
+                if isinstance(message, BaseException):
+                    raise message
+
+                if message[0] == "stop":
+                    break
+
+                if message[0] == "lease":
+                    _, lease_id, seed, rng_seed, n_iterations, inputs = message
+                    pool.apply_async(_fuzz_seed, ((indexes[seed], rng_seed, n_iterations, inputs),),
+                                     callback=lambda result, lease_id=lease_id, seed=seed: events.put(("done", lease_id, seed, result)), error_callback=events.put)
+
+                elif message[0] == "done":
+                    _, lease_id, seed, result = message
+                    runs += 1
+                    send(("result", lease_id, seed, result))
+                    send(("request", 1))
+    except KeyboardInterrupt:
+        pass
+    except OSError:
+        print("Lost the connection to the coordinator")
+    finally:
+        stopped.set()
+        connection.close()
+        print(f"Node {name} stopped after {runs} runs")
@@ -0,0 +1,79 @@
+import struct
+
+
+_ELF_MAGIC = b"\x7fELF"
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+
+_SHT_SYMTAB = 2
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+_STT_FUNC = 2
+
+# (header fields, section header, symbol) layouts for ELF32 and ELF64
+_LAYOUTS = {
+    False: ("16xHHIIIIIHHHHHH", "IIIIIIIIII", "IIIBBH"),
+    True: ("16xHHIQQQIHHHHHH", "IIQQQQIIQQ", "IBBHQQ"),
+}
+
+
+def is_elf(data: bytes) -> bool:
+    """Whether the data starts like an ELF file."""
+    return data[:4] == _ELF_MAGIC
+
+
+def object_sizes(data: bytes) -> tuple[int, dict[str, int]]:
+    """Read the size of the code of a relocatable ELF object.
+
+    Args:
+        data (bytes): the content of the object file
+
+    Raises:
+        ValueError: if the data is not an ELF object or it is truncated
+
+    Returns:
+        tuple[int, dict[str, int]]: the size in bytes of the executable sections and the size of each function
+    """
+
+    if not is_elf(data) or len(data) < 52:
+        raise ValueError("Not an ELF object")
+
+    try:
+        return _read_sizes(data)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Truncated ELF object: {e}") from e
+
+
+def _read_sizes(data: bytes) -> tuple[int, dict[str, int]]:
+    is_64 = data[4] == _ELFCLASS64
+    endian = "<" if data[5] == _ELFDATA2LSB else ">"
+    header_layout, section_layout, symbol_layout = _LAYOUTS[is_64]
+
+    header = struct.unpack_from(endian + header_layout, data)
+    sh_offset, sh_entsize, sh_num = header[5], header[10], header[11]
+
+    sections = [struct.unpack_from(endian + section_layout, data, sh_offset + i * sh_entsize) for i in range(sh_num)]
+    # name, type, flags, addr, offset, size, link, info, addralign, entsize
+    text_size = sum(section[5] for section in sections if section[2] & _SHF_ALLOC and section[2] & _SHF_EXECINSTR)
+
+    functions = {}
+    for section in sections:
+        if section[1] != _SHT_SYMTAB:
+            continue
+
+        strtab = sections[section[6]]
+        for offset in range(section[4], section[4] + section[5], section[9]):
+            symbol = struct.unpack_from(endian + symbol_layout, data, offset)
+            if is_64:
+                name_offset, info, size = symbol[0], symbol[1], symbol[5]
+            else:
+                name_offset, info, size = symbol[0], symbol[3], symbol[2]
+
+            if info & 0xf != _STT_FUNC:
+                continue
+
+            start = strtab[4] + name_offset
+            name = data[start:data.index(b"\0", start)].decode("utf-8", errors="replace")
+            functions[name] = functions.get(name, 0) + size
+
+    return text_size, functions
@@ -1,24 +1,86 @@
 from modules.compiler import Compiler, Stats
 from modules.strategies.mutator import Mutator
+from modules.strategies.evolution import Population
+from modules.strategies.scheduler import StrategyScheduler
 from modules.data_loader import DataLoader
-from modules.test import FuzzedTest, Input, Test
+from modules.journal import Journal, SeedProgress
+from modules.seed_scheduler import SeedScheduler
+from modules.telemetry import TelemetryWriter, reset_telemetry, telemetry
+from modules.validator import AsanValidator, Candidate, Verdict
+from modules.test import FuzzedTest, Input, MutatedInputs, TaskResult, Test
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+import dataclasses
 import multiprocessing as mp
-import copy
+import queue
+import threading
 import traceback
 import random
+
+
+_worker: "Fuzzer | None" = None
+"""The fuzzer of a worker process, set once by the initializer of the pool."""
+
+
+def _init_worker(fuzzer: "Fuzzer", candidates: "mp.Queue | None" = None, confirmed=None):
+    global _worker
+    _worker = fuzzer
+    # set only with a validator pool: where to send the candidates, and which seeds are already confirmed
+    _worker._candidates = candidates
+    _worker._confirmed = confirmed
+    reset_telemetry()
+
+
+def _forward(candidates: mp.Queue, results: queue.Queue):
+    """Move the candidates sent by the workers to the results of the main process, until None is sent."""
+    for candidate in iter(candidates.get, None):
+        results.put(candidate)
+
+
+def _fuzz_seed(task: tuple[int, int, int, dict[int, str] | None]) -> TaskResult:
+    """Fuzz the seed with the given index in a worker process."""
+    index, rng_seed, n_iterations, inputs = task
+    return _worker.fuzz_seed(index, rng_seed, n_iterations, inputs)
+
     
 class Fuzzer:
     """The fuzzer."""
     
-    def __init__(self, tests: list[Test], compiler: Compiler, mutator: Mutator, data_loader: DataLoader, num_cores: int, n_threshold: int = 10):
+    def __init__(self, tests: list[Test], compiler: Compiler, mutator: Mutator, data_loader: DataLoader, num_cores: int, n_threshold: int = 10, batch_size: int = 1, count_instructions: bool = False, strategy_scheduler: str = "fixed", seed_scheduler: str = "uniform", search: str = "random", population_size: int = 16, generation_workers: int = 1, asan_workers: int = 0, telemetry_writer: TelemetryWriter | None = None, journal: Journal | None = None, progress: dict[str, SeedProgress] | None = None):
         self.tests = tests
+        self.telemetry_writer = telemetry_writer
+        self.strategy_scheduler = strategy_scheduler
+        self.seed_scheduler = seed_scheduler
+        self.search = search
+        self.population_size = population_size
+        self.generation_workers = generation_workers
+        self.asan_workers = asan_workers
+        self._candidates = None
+        self._confirmed = None
+        self._index = None
+        self._emitted = 0
+        self.journal = journal
+        self.progress = progress if progress is not None else {}
+        self._best_rateo = 0.0
+        self._best_inputs = None
+        self._iterations = 0
+        self._strategies = {}
+        self.batch_size = batch_size
+        self.count_instructions = count_instructions
         self.compiler = compiler
         self.num_cores = num_cores
         self.n_threshold = n_threshold
         self.mutator = mutator
         self.data_loader = data_loader
-    
+
+    def __getstate__(self):
+        # only the main process writes the journal and the telemetry, and the open journal cannot be pickled
+        # for the workers started with spawn
+        state = self.__dict__.copy()
+        state["journal"] = None
+        state["telemetry_writer"] = None
+        return state
+
     def fuzz(self, loaded_interesting_tests: list[Stats]):
         """
         Fuzz the tests.
@@ -28,41 +90,102 @@ class Fuzzer:
         """  
               
         n_file_found = len(loaded_interesting_tests)
-        list_of_fuzzed_tests = [FuzzedTest(test=test, mutated_inputs={i: copy.deepcopy(input) for i, input in test.inputs.items()}, stats=None) 
-                                for test in self.tests if test.has_valid_inputs() and test.name not in [stat.file_path for stat in loaded_interesting_tests]]
-        
-        random.shuffle(list_of_fuzzed_tests)
+        loaded_names = {stat.file_path for stat in loaded_interesting_tests}
+        # the workers already have the tests, so only their indexes are sent
+        seeds = [i for i, test in enumerate(self.tests) if test.has_valid_inputs() and test.name not in loaded_names]
         
-        best_mutations: FuzzedTest = []
         interesting_tests: list[Stats] = []
-        print(f"Start fuzzing {len(list_of_fuzzed_tests)} tests with {self.num_cores} cores. Threshold: {self.n_threshold}")
+        print(f"Start fuzzing {len(seeds)} tests with {self.num_cores} cores. Threshold: {self.n_threshold}")
 
 
         pbar = tqdm(total=self.n_threshold, initial=n_file_found)
+        scheduler = SeedScheduler(seeds, energy=self.seed_scheduler == "energy")
+        # continue the search of the seeds from the state stored in the journal
+        scheduler.restore({index: self.progress[self.tests[index].name] for index in seeds if self.tests[index].name in self.progress})
+        results = queue.Queue()
+        in_flight = 0
+
+        validator = None
+        candidates = None
+        confirmed = None
+        # runs without findings whose candidates are still being validated, and the candidates received for each seed
+        waiting: dict[int, TaskResult] = {}
+        received: dict[int, int] = {}
+        if self.asan_workers > 0:
+            validator = AsanValidator(self.compiler, self.asan_workers, results)
+            candidates = mp.Queue()
+            confirmed = mp.Array("b", len(self.tests), lock=False)
+            threading.Thread(target=_forward, args=(candidates, results), daemon=True).start()
        
         try:
-            while True:
-                    with mp.Pool(self.num_cores) as pool:
-                            best_mutations = pool.imap_unordered(self.single_mutation, list_of_fuzzed_tests)
-                            inner_bar = tqdm(total=len(list_of_fuzzed_tests), leave=False, desc="Mutating tests")
-                            for test in best_mutations:
-                                inner_bar.update()
-                                if test is not None:
-                                    pbar.update()
-                                    n_file_found += 1
-                                    pbar.set_description(f"Found new mutation: {test.test.name} with {test.stats.max_rateo[0]}")
-                                    self.data_loader.save_results(test.stats)
-                                    interesting_tests.append(test.stats)
-
-                                    if n_file_found >= self.n_threshold:
-                                        pbar.close()
-                                        inner_bar.close()
-                                        return interesting_tests
+            # the pool lives for the whole run, its workers receive the fuzzer only once
+            with mp.Pool(self.num_cores, initializer=_init_worker, initargs=(self, candidates, confirmed)) as pool:
+                runs_bar = tqdm(leave=False, desc="Mutating tests")
+                while True:
+                    # keep the workers busy, but choose each seed as late as possible so that it uses the latest energies
+                    while in_flight < 2 * self.num_cores and (task := scheduler.next()) is not None:
+                        index, n_iterations = task
+                        progress = self.progress.get(self.tests[index].name)
+                        inputs = progress.best_inputs if progress is not None else None
+                        pool.apply_async(_fuzz_seed, ((index, random.getrandbits(64), n_iterations, inputs),), callback=results.put, error_callback=results.put)
+                        in_flight += 1
+                    if in_flight == 0 and not waiting:
+                        break
 
-                            
-                            list_of_fuzzed_tests = [ test for test in list_of_fuzzed_tests if test.test.name  not in [stat.file_path for stat in interesting_tests]]
-                            random.shuffle(list_of_fuzzed_tests)
-                            inner_bar.close()
+                    result = results.get()
+                    if isinstance(result, BaseException):
+                        raise result
+
+                    if isinstance(result, Candidate):
+                        received[result.index] = received.get(result.index, 0) + 1
+                        validator.submit(result)
+                        continue
+
+                    if isinstance(result, Verdict):
+                        validator.settle(result)
+                        if result.index in validator.confirmed:
+                            continue
+                        if not result.safe:
+                            run = waiting.get(result.index)
+                            if run is not None and received.get(result.index, 0) >= run.candidates and not validator.pending(result.index):
+                                del waiting[result.index]
+                                del received[result.index]
+                                self._finish_run(scheduler, run)
+                            continue
+                        # stop the workers still fuzzing the seed and drop its other candidates
+                        validator.confirm(result.index)
+                        confirmed[result.index] = 1
+                        waiting.pop(result.index, None)
+                        stats = result.stats
+                    else:
+                        in_flight -= 1
+                        runs_bar.update()
+                        telemetry.merge(result.telemetry)
+                        telemetry.count("seeds", "done")
+                        if self.telemetry_writer is not None:
+                            self.telemetry_writer.write(telemetry)
+
+                        if validator is not None and result.index in validator.confirmed:
+                            continue
+
+                        if result.stats is None:
+                            if validator is not None and (received.get(result.index, 0) < result.candidates or validator.pending(result.index)):
+                                waiting[result.index] = result
+                                continue
+                            received.pop(result.index, None)
+                            self._finish_run(scheduler, result)
+                            continue
+                        stats = result.stats
+
+                    self._save_found(scheduler, result.index, stats)
+                    pbar.update()
+                    n_file_found += 1
+                    pbar.set_description(f"Found new mutation: {stats.file_path} with {stats.max_rateo[0]}")
+                    interesting_tests.append(stats)
+
+                    if n_file_found >= self.n_threshold:
+                        break
+                runs_bar.close()
                             
         except KeyboardInterrupt:
             pass
@@ -70,64 +193,238 @@ class Fuzzer:
             traceback.print_exc()
         finally:     
             pbar.close()
+            if validator is not None:
+                validator.shutdown()
+                candidates.put(None)
+            if self.telemetry_writer is not None:
+                self.telemetry_writer.write(telemetry, force=True)
             return interesting_tests
     
-    def single_mutation(self, fuzzed_test: FuzzedTest):
+    def _save_found(self, scheduler: SeedScheduler, index: int, stats: Stats):
+        """
+        Stop scheduling a seed with an interesting mutation, and save the mutation.
+        """
+        scheduler.mark_found(index)
+        if self.journal is not None:
+            self.journal.record_found(stats)
+        telemetry.count("seeds", "found")
+        self.data_loader.save_results(stats)
+
+    def _finish_run(self, scheduler: SeedScheduler, result: TaskResult):
+        """
+        Schedule again a seed after a run without findings.
+        """
+        scheduler.update(result.index, result.best_rateo, result.compile_seconds)
+        self._record_progress(scheduler, result)
+
+    def _record_progress(self, scheduler: SeedScheduler, result: TaskResult):
+        """
+        Update the search state of a seed after a run without findings, and append it to the journal.
+        """
+        name = self.tests[result.index].name
+        progress = self.progress.setdefault(name, SeedProgress())
+        progress.iterations += result.iterations
+        if result.best_inputs is not None and result.best_rateo > progress.best_rateo:
+            progress.best_rateo = result.best_rateo
+            progress.best_inputs = result.best_inputs
+        for strategy, tries in result.strategies.items():
+            progress.strategies[strategy] = progress.strategies.get(strategy, 0) + tries
+        progress.visits = scheduler.visits[result.index]
+        progress.energy = scheduler.energy[result.index] if scheduler.use_energy else None
+        progress.failures = scheduler.failures[result.index]
+        progress.retired = result.index in scheduler.retired
+        
+        if self.journal is not None:
+            self.journal.record_run(name, progress, result.iterations, result.best_rateo, result.best_inputs, result.strategies)
+
+    def fuzz_seed(self, index: int, rng_seed: int, n_iterations: int = SeedScheduler.BASE_ENERGY, inputs: dict[int, str] | None = None) -> TaskResult:
+        """
+        Fuzz a seed in a worker.
+        
+        Args:
+            index (int): the index of the test in the tests of the fuzzer
+            rng_seed (int): the seed of the random generator, so that the workers do not share the sequence inherited from the main process
+            n_iterations (int): the number of random mutations of the seed
+            inputs (dict[int, str] | None): the values of the inputs to start from, e.g. the best ones of a previous run
+        
+        Returns:
+            TaskResult: the stats of the interesting mutation, if any, and the telemetry recorded meanwhile
+        """
+        random.seed(rng_seed)
+        test = self.tests[index]
+        mutated_inputs = MutatedInputs(test.inputs)
+        if inputs is not None:
+            mutated_inputs = mutated_inputs.with_values(inputs)
+        fuzzed_test = FuzzedTest(test=test, mutated_inputs=mutated_inputs, stats=None)
+        
+        self._best_rateo = 0.0
+        self._best_inputs = None
+        self._iterations = 0
+        self._strategies = {}
+        self._index = index
+        self._emitted = 0
         try:
-            return self._single_mutation(fuzzed_test)
+            result = self._single_mutation(fuzzed_test, n_iterations)
         except Exception as e:
             traceback.print_exc()
-            return None
+            telemetry.count("seeds", "error")
+            result = None
+        
+        recorded = telemetry.drain()
+        compiles = [recorded["histograms"][key] for key in recorded["histograms"] if key[0] in ("compile", "compile_batch")]
+        n_compiles = sum(count for _, _, count in compiles)
+        compile_seconds = sum(total for _, total, _ in compiles) / n_compiles if n_compiles else None
+        
+        return TaskResult(index=index, stats=result.stats if result is not None else None, best_rateo=self._best_rateo, compile_seconds=compile_seconds, 
+                          iterations=self._iterations, best_inputs=self._best_inputs, strategies=self._strategies, telemetry=recorded, candidates=self._emitted)
         
-    def _single_mutation(self, fuzzed_test: FuzzedTest):
+    def _single_mutation(self, fuzzed_test: FuzzedTest, n_iterations: int = SeedScheduler.BASE_ENERGY):
         """
         Perform a single round of mutation on a file.
         """
         
         # check without mutation if the test is interesting
         try:
-            no_mut = self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, fuzzed_test.test.inputs), fuzzed_test.mutated_inputs))
-            if no_mut.stats.is_interesting() and no_mut.is_asan_safe(self.compiler):
+            # the inputs of the seed, not the best ones of a resumed run, so that the rateo is tracked under the inputs that produced it
+            seed_inputs = MutatedInputs(fuzzed_test.test.inputs)
+            no_mut = self._track(self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, seed_inputs), seed_inputs)))
+            if no_mut.stats.is_interesting() and self._accept(no_mut):
                 return no_mut
 
-            fuzzed = self._find_best_mutations(fuzzed_test, n_iterations=50)
-            if fuzzed is None:
+            if self.search == "evolutionary":
+                fuzzed = self._evolve_best_mutations(fuzzed_test, n_iterations=n_iterations)
+            else:
+                fuzzed = self._find_best_mutations(fuzzed_test, n_iterations=n_iterations)
+            if fuzzed is None or self._is_confirmed():
                 return None
             
             # reduction
             fuzzed = self._reduce_test(fuzzed)
             
-            if fuzzed.stats.is_interesting():
-                fuzzed.stats.strategy_mutation = "Random"
+            search_strategy = "Evolutionary" if self.search == "evolutionary" else "Random"
+            if fuzzed.stats.is_interesting() and self._accept(fuzzed, asan_checked=True, strategy=search_strategy):
+                fuzzed.stats.strategy_mutation = search_strategy
                 return fuzzed
             
+            # the bandit learns per seed which strategies improve the rateo
+            scheduler = StrategyScheduler(list(self.mutator.strategies)) if self.strategy_scheduler == "bandit" else None
+            
             for i in fuzzed.mutated_inputs:
-                if fuzzed.mutated_inputs[i].interesting:
-                    for strategy in self.mutator.STRATEGY_TRIES:
-                            fuzzed.mutated_inputs[i].value = self._mutate_input(fuzzed.mutated_inputs[i], strategy)
-                            fuzzed = self.compiler.compile_test((fuzzed.test, self.apply(fuzzed.test, fuzzed.mutated_inputs), fuzzed.mutated_inputs))
+                if fuzzed.mutated_inputs.is_interesting(i):
+                    input_type = fuzzed.mutated_inputs.base[i].type
+                    # the rewards of the bandit are measured against the best rateo of the input, starting from the current one
+                    best_rateo = fuzzed.stats.max_rateo[0]
+                    for n_try in range(len(self.mutator.STRATEGY_TRIES)):
+                            if self._is_confirmed():
+                                return None
+                            elif scheduler is None:
+                                strategy = self.mutator.STRATEGY_TRIES[n_try]
+                            elif scheduler.exhausted(input_type):
+                                break
+                            else:
+                                strategy = scheduler.choose(input_type)
+
+                            self._strategies[strategy] = self._strategies.get(strategy, 0) + 1
+                            self._iterations += 1
+                            mutated_inputs = fuzzed.mutated_inputs.with_value(i, self._mutate_input(fuzzed.mutated_inputs[i], strategy))
+                            fuzzed = self._track(self.compiler.compile_test((fuzzed.test, self.apply(fuzzed.test, mutated_inputs), mutated_inputs)))
+
+                            if scheduler is not None:
+                                scheduler.update(input_type, strategy, best_rateo, fuzzed.stats.max_rateo[0])
+                                best_rateo = max(best_rateo, fuzzed.stats.max_rateo[0])
                                             
-                            if fuzzed.stats.is_interesting() and fuzzed.is_asan_safe(compiler=self.compiler):
+                            if fuzzed.stats.is_interesting() and self._accept(fuzzed, strategy=strategy):
                                 fuzzed.stats.strategy_mutation = strategy
                                 return fuzzed
             return None
         except KeyboardInterrupt:
             return None
 
+
+    def _track(self, fuzzed_test: FuzzedTest) -> FuzzedTest:
+        """
+        Keep track of the best rateo reached by the seed, reported to the seed scheduler.
+        """
+        if fuzzed_test.stats.max_rateo[0] > self._best_rateo:
+            self._best_rateo = fuzzed_test.stats.max_rateo[0]
+            self._best_inputs = fuzzed_test.mutated_inputs.values_by_index()
+        return fuzzed_test
+
+    def _accept(self, fuzzed_test: FuzzedTest, asan_checked: bool = False, strategy: str = "Not mutated") -> bool:
+        """
+        Whether an interesting mutant is ASAN safe and, if enabled, runs slower.
+        With a validator pool the mutant is sent to the main process to be checked with ASAN instead,
+        and the search goes on as if it was not safe until the seed is confirmed.
+        """
+        if self._candidates is None:
+            return (asan_checked or fuzzed_test.is_asan_safe(self.compiler)) and self._runs_slower(fuzzed_test)
+
+        if self._runs_slower(fuzzed_test):
+            stats = dataclasses.replace(fuzzed_test.stats, strategy_mutation=strategy)
+            self._candidates.put(Candidate(index=self._index, stats=stats))
+            self._emitted += 1
+        return False
+
+    def _is_confirmed(self) -> bool:
+        """
+        Whether the validator pool already confirmed a candidate of the seed, so that its search can stop.
+        """
+        return self._confirmed is not None and self._confirmed[self._index] == 1
+
+    def _runs_slower(self, fuzzed_test: FuzzedTest) -> bool:
+        """
+        Confirm with the executed instructions that an interesting test runs slower, if enabled.
+        """
+        return not self.count_instructions or fuzzed_test.runs_slower(self.compiler)
     
     def _reduce_test(self, fuzzed_test: FuzzedTest) -> FuzzedTest:
         """
-        Reduce the test by removing the inputs that do not affect the result.
+        Reduce the test to the smallest set of mutated inputs that keeps its rateo, with delta debugging (ddmin).
+        The other inputs are reverted to the values of the seed and marked as not interesting.
         """
-        for i in fuzzed_test.mutated_inputs:
+        mutated_inputs = fuzzed_test.mutated_inputs
+        memo: dict[frozenset[int], FuzzedTest | None] = {frozenset(mutated_inputs.changes): fuzzed_test}
+
+        def keeps_rateo(subset: list[int]) -> bool:
+            key = frozenset(subset)
+            if key not in memo:
+                new_inputs = MutatedInputs(mutated_inputs.base, {i: mutated_inputs.changes[i] for i in subset}, mutated_inputs.boring)
+                new_fuzzed = self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, new_inputs), new_inputs))
+                memo[key] = new_fuzzed if new_fuzzed.has_improved(fuzzed_test.stats) else None
+            return memo[key] is not None
+
+        changed = sorted(mutated_inputs.changes)
+        n = 2
+        if keeps_rateo([]):
+            changed = []
+        while len(changed) >= 2:
+            size = -(-len(changed) // n)
+            chunks = [changed[start:start + size] for start in range(0, len(changed), size)]
             
-            new_inputs = copy.deepcopy(fuzzed_test.mutated_inputs)
-            new_inputs[i].value = fuzzed_test.test.inputs[i].value
-            new_fuzzed = self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, new_inputs), new_inputs))
-            if new_fuzzed.has_improved(fuzzed_test.stats):
-                 fuzzed_test.mutated_inputs[i].interesting = False
+            reduced = next((chunk for chunk in chunks if keeps_rateo(chunk)), None)
+            if reduced is not None:
+                changed, n = reduced, 2
+                continue
+            
+            complements = [[i for i in changed if i not in chunk] for chunk in chunks] if len(chunks) > 2 else []
+            reduced = next((complement for complement in complements if keeps_rateo(complement)), None)
+            if reduced is not None:
+                changed, n = reduced, max(n - 1, 2)
+                continue
+            
+            if n >= len(changed):
+                break
+            n = min(len(changed), 2 * n)
 
-        return fuzzed_test
+        reduced_test = memo[frozenset(changed)]
+        # the reduced mutant is a different program, it must be checked again
+        # with a validator pool, it is checked when it is sent as a candidate
+        if reduced_test is not fuzzed_test and self._candidates is None and not reduced_test.is_asan_safe(self.compiler):
+            reduced_test = fuzzed_test
+        
+        boring = frozenset(i for i in mutated_inputs if i not in changed)
+        reduced_test.mutated_inputs = MutatedInputs(mutated_inputs.base, reduced_test.mutated_inputs.changes, boring)
+        return reduced_test
 
     def _find_best_mutations(self, fuzzed_test: FuzzedTest, n_iterations = 100) ->  FuzzedTest:
         """
@@ -135,16 +432,96 @@ class Fuzzer:
         """
         
         mutations = []
-        for i in range(n_iterations):
+        # the same mutant is compiled once, e.g. when the strategies draw from few boundary values
+        seen = set()
+        if self.batch_size > 1:
+            walk = fuzzed_test
+            for start in range(0, n_iterations, self.batch_size):
+                batch = []
+                for i in range(start, min(start + self.batch_size, n_iterations)):
+                    mutated_inputs = self.mutate_inputs(walk)
+                    walk = FuzzedTest(test=walk.test, stats=None, mutated_inputs=mutated_inputs)
+                    if mutated_inputs not in seen:
+                        seen.add(mutated_inputs)
+                        batch.append((self.apply(fuzzed_test.test, mutated_inputs), mutated_inputs))
+                if batch:
+                    mutations += self.compiler.compile_test_batch(fuzzed_test.test, batch)
+        else:
+            for i in range(n_iterations):
 
-            mutated_inputs = self.mutate_inputs(fuzzed_test)
-            fuzzed_test = self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, mutated_inputs), mutated_inputs))
-            mutations.append(fuzzed_test)
+                mutated_inputs = self.mutate_inputs(fuzzed_test)
+                if mutated_inputs in seen:
+                    fuzzed_test = FuzzedTest(test=fuzzed_test.test, stats=fuzzed_test.stats, mutated_inputs=mutated_inputs)
+                    continue
+                seen.add(mutated_inputs)
+                fuzzed_test = self.compiler.compile_test((fuzzed_test.test, self.apply(fuzzed_test.test, mutated_inputs), mutated_inputs))
+                mutations.append(fuzzed_test)
             
+        self._iterations += len(mutations)
+        if not mutations:
+            return None
+        self._track(max(mutations, key=lambda x: x.stats.max_rateo[0]))
+        return self._first_asan_safe(mutations)
+
+    def _evolve_best_mutations(self, fuzzed_test: FuzzedTest, n_iterations = 100) -> FuzzedTest:
+        """
+        Evolve a population of mutants of a test with at most n_iterations compilations and return the best mutation.
+        The search stops early once a mutant is interesting or the best rateo reaches a plateau.
+        """
+
+        population = Population(self.population_size)
+        # the compiled mutants, so that a child equal to an earlier mutant reuses its score
+        evaluated: dict[MutatedInputs, FuzzedTest] = {}
+        generation = [fuzzed_test.mutated_inputs] + [self.mutate_inputs(fuzzed_test) for _ in range(self.population_size - 1)]
+
+        with ThreadPoolExecutor(max_workers=self.generation_workers) as executor:
+            while True:
+                generation = list(dict.fromkeys(inputs for inputs in generation if inputs not in evaluated))[:n_iterations - len(evaluated)]
+                compiled = self._evaluate_generation(executor, fuzzed_test.test, generation)
+                for fuzzed in compiled:
+                    evaluated[fuzzed.mutated_inputs] = self._track(fuzzed)
+                population.add_generation(compiled)
+
+                if len(evaluated) >= n_iterations or population.plateau or population.best.stats.is_interesting() or self._is_confirmed():
+                    break
+                generation = [self._mutate_some(population.offspring()) for _ in range(self.population_size)]
+
+        self._iterations += len(evaluated)
+        return self._first_asan_safe(list(evaluated.values()))
+
+    def _evaluate_generation(self, executor: ThreadPoolExecutor, test: Test, generation: list[MutatedInputs]) -> list[FuzzedTest]:
+        """
+        Compile the mutants of a generation, `batch_size` per invocation of the compilers and `generation_workers` invocations at a time.
+        """
+        mutants = [(self.apply(test, inputs), inputs) for inputs in generation]
+        if self.batch_size > 1:
+            compile = lambda chunk: self.compiler.compile_test_batch(test, chunk)
+        else:
+            compile = lambda chunk: [self.compiler.compile_test((test, *mutant)) for mutant in chunk]
+
+        chunks = [mutants[start:start + max(self.batch_size, 1)] for start in range(0, len(mutants), max(self.batch_size, 1))]
+        compiled = executor.map(compile, chunks) if self.generation_workers > 1 else map(compile, chunks)
+        return [fuzzed for chunk in compiled for fuzzed in chunk]
+
+    def _mutate_some(self, inputs: MutatedInputs) -> MutatedInputs:
+        """
+        Mutate each input with probability 1/n, and at least one, with the strategies drawn with fixed probabilities.
+        """
+        indexes = list(inputs)
+        chosen = [i for i in indexes if random.random() < 1 / len(indexes)] or [random.choice(indexes)]
+        return inputs.with_values({i: self.mutator.mutate(inputs[i]) for i in chosen})
+
+    def _first_asan_safe(self, mutations: list[FuzzedTest]) -> FuzzedTest | None:
+        """
+        Return the mutant with the best rateo among the five best ones that is ASAN safe.
+        """
         best_mutants = sorted(mutations, key=lambda x: x.stats.max_rateo[0])
-        
+        if self._candidates is not None:
+            # the result is only a starting point: a validator pool checks it if it is interesting
+            return best_mutants[-1] if best_mutants and best_mutants[-1].stats.max_rateo[0] > 0 else None
+
         try_asan = 0
-        while try_asan < 5:
+        while try_asan < 5 and best_mutants:
             try_asan += 1
             best_mutant = best_mutants.pop()
             
@@ -156,27 +533,22 @@ class Fuzzer:
 
         return None
         
-    def apply(self, test: Test, inputs: dict[int, Input]) -> str:
+    def apply(self, test: Test, inputs: MutatedInputs) -> str:
         """
         Apply to the test the inputs.
 
         Args:
             test (Test): the test to mutate 
-            inputs (list[Input]): the inputs to mutate
+            inputs (MutatedInputs): the inputs to mutate
             
         Returns:
             str: the mutated test content
         """
         
-        file_content = test.file_pattern
-
-        for i, input in inputs.items():
-            array = f"[{input.len}]" if input.len is not None else ""
-            file_content = file_content.replace(f"[INPUT_{i}]", f'{input.name}{array} = {input.value}')
-    
-        return file_content
+        with telemetry.time("apply"):
+            return test.template.render(inputs)
 
-    def mutate_inputs(self, test: FuzzedTest) -> dict[int, Input]:
+    def mutate_inputs(self, test: FuzzedTest) -> MutatedInputs:
         """
         Mutate the test inputs.
         
@@ -184,13 +556,10 @@ class Fuzzer:
             test (Test): the original test
             
         Returns:
-            dict[Input]: the mutated inputs
+            MutatedInputs: the mutated inputs
         """
         
-        new_inputs = test.mutated_inputs.copy()
-        for i in range(len(test.mutated_inputs)):
-                new_inputs[i].value = self._mutate_input(test.mutated_inputs[i])
-        return new_inputs
+        return test.mutated_inputs.with_values({i: self._mutate_input(test.mutated_inputs[i]) for i in test.mutated_inputs})
     
     def _mutate_input(self, input: Input, strategy: str = "Random"):
         return self.mutator.mutate(input, strategy)
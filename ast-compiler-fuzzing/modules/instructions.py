@@ -0,0 +1,79 @@
+import ctypes
+import os
+import signal
+import sys
+import time
+
+
+_PTRACE_TRACEME = 0
+_PTRACE_SINGLESTEP = 9
+
+_libc = None
+
+
+def _ptrace():
+    """The ptrace function of the C library, loaded lazily."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.ptrace.argtypes = [ctypes.c_long, ctypes.c_long, ctypes.c_void_p, ctypes.c_void_p]
+        _libc.ptrace.restype = ctypes.c_long
+    return _libc.ptrace
+
+
+def count_instructions(binary: str, cap: int, timeout: float) -> tuple[int, bool]:
+    """Count the instructions executed by a binary by single-stepping it with ptrace.
+    NOTE: the count includes the startup of the program, e.g. the dynamic loader.
+
+    Args:
+        binary (str): path of the binary to run
+        cap (int): maximum number of instructions to execute
+        timeout (float): maximum number of seconds to run
+
+    Raises:
+        OSError: if the binary cannot be traced
+
+    Returns:
+        tuple[int, bool]: the number of executed instructions and whether the execution was stopped before the end
+    """
+
+    if not sys.platform.startswith("linux"):
+        raise OSError("Counting instructions is only supported on Linux")
+
+    ptrace = _ptrace()
+    binary = os.path.abspath(binary)
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ptrace(_PTRACE_TRACEME, 0, None, None)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            os.execv(binary, [binary])
+        finally:
+            os._exit(127)
+
+    # the child stops at exec
+    _, status = os.waitpid(pid, 0)
+    if not os.WIFSTOPPED(status):
+        raise OSError(f"Could not trace {binary}")
+
+    count = 0
+    deadline = time.monotonic() + timeout
+    while os.WIFSTOPPED(status):
+        if count >= cap or (count % 4096 == 0 and time.monotonic() > deadline):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            return count, True
+
+        sig = os.WSTOPSIG(status)
+        if ptrace(_PTRACE_SINGLESTEP, pid, None, None if sig == signal.SIGTRAP else sig) != 0:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise OSError(ctypes.get_errno(), f"Could not single-step {binary}")
+
+        _, status = os.waitpid(pid, 0)
+        count += 1
+
+    return count, False
@@ -0,0 +1,133 @@
+import dataclasses
+import json
+import os
+import time
+from modules.test import Stats
+
+
+@dataclasses.dataclass
+class SeedProgress:
+    """The search state of a seed, rebuilt from the journal."""
+
+    iterations: int = 0
+    """Number of mutants compiled so far."""
+
+    best_rateo: float = 0.0
+    """Best rateo reached so far."""
+
+    best_inputs: dict[int, str] | None = None
+    """Values of the inputs of the mutant with the best rateo, None if no mutant compiled."""
+
+    strategies: dict[str, int] = dataclasses.field(default_factory=dict)
+    """Number of tries of each mutation strategy."""
+
+    visits: int = 0
+    """Number of runs of the seed."""
+
+    energy: int | None = None
+    """Energy of the seed in the seed scheduler, None if not scheduled by energy."""
+
+    failures: int = 0
+    """Consecutive runs without a compiled mutant."""
+
+    retired: bool = False
+    """Whether the seed scheduler retired the seed."""
+
+
+class Journal:
+    """Append-only JSONL log of a campaign, written by the main process as the results arrive.
+
+    Each line is either a `run` record, with the progress of a seed after a run without findings,
+    or a `found` record, with the stats of an interesting mutation. Lines are flushed as they are
+    written, so they survive a crash of the fuzzer, and fsynced at most every `fsync_interval`
+    seconds, so that a power loss costs at most that much work.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 5):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a")
+        self._last_sync = time.monotonic()
+
+    def _append(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def record_run(self, seed: str, progress: SeedProgress, iterations: int, rateo: float, inputs: dict[int, str] | None, strategies: dict[str, int]):
+        """Append the result of a run without findings.
+
+        Args:
+            seed (str): the path of the seed
+            progress (SeedProgress): the state of the seed after the run
+            iterations (int): the mutants compiled by the run
+            rateo (float): the best rateo of the run
+            inputs (dict[int, str] | None): the inputs of the best mutant of the run
+            strategies (dict[str, int]): the strategies tried by the run
+        """
+        self._append({
+            "event": "run",
+            "seed": seed,
+            "iterations": iterations,
+            "rateo": rateo,
+            "inputs": inputs,
+            "strategies": strategies,
+            "visits": progress.visits,
+            "energy": progress.energy,
+            "failures": progress.failures,
+            "retired": progress.retired,
+        })
+
+    def record_found(self, stats: Stats):
+        """Append an interesting mutation."""
+        self._append({"event": "found", "seed": stats.file_path, "stats": dataclasses.asdict(stats)})
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    @staticmethod
+    def replay(path: str) -> tuple[dict[str, SeedProgress], list[Stats]]:
+        """Rebuild the state of a campaign from its journal, in a single pass.
+        A truncated last line, e.g. left by a crash while writing, is ignored.
+
+        Args:
+            path (str): the path of the journal
+
+        Returns:
+            tuple[dict[str, SeedProgress], list[Stats]]: the progress of each seed and the interesting mutations found
+        """
+
+        progress: dict[str, SeedProgress] = {}
+        found: dict[str, Stats] = {}
+
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if record["event"] == "found":
+                    found[record["seed"]] = Stats(**record["stats"])
+                    continue
+
+                seed = progress.setdefault(record["seed"], SeedProgress())
+                seed.iterations += record["iterations"]
+                if record["inputs"] is not None and record["rateo"] > seed.best_rateo:
+                    seed.best_rateo = record["rateo"]
+                    seed.best_inputs = {int(i): value for i, value in record["inputs"].items()}
+                for strategy, tries in record["strategies"].items():
+                    seed.strategies[strategy] = seed.strategies.get(strategy, 0) + tries
+                seed.visits = record["visits"]
+                seed.energy = record["energy"]
+                seed.failures = record["failures"]
+                seed.retired = record["retired"]
+
+        print(f"Replayed the journal of {len(progress)} seeds, {len(found)} interesting stat")
+        return progress, list(found.values())
@@ -0,0 +1,100 @@
+import collections
+import math
+import os
+import shutil
+import signal
+import subprocess
+
+_PRLIMIT = shutil.which("prlimit")
+"""The prlimit of util-linux, which sets the limits of the commands, if installed."""
+
+
+def can_limit() -> bool:
+    """Whether the CPU time and the address space of the commands can be limited."""
+    return _PRLIMIT is not None
+
+
+def run(args: list[str], timeout: float | None = None, cpu_seconds: int | None = None, memory: int | None = None, **kwargs) -> subprocess.CompletedProcess:
+    """Run a command like subprocess.run, in a process group of its own and with resource limits.
+    On timeout the whole group is killed, e.g. also the cc1 and as started by a compiler driver, and TimeoutExpired is raised.
+    The limits are set before the command starts by prlimit, which executes it, instead of a preexec_fn, which is
+    not safe with threads; the processes it starts, e.g. cc1 and as, inherit them. Without prlimit they are not set.
+
+    Args:
+        args (list[str]): the command
+        timeout (float | None): the seconds before the process group is killed, None for no limit
+        cpu_seconds (int | None): the CPU seconds of each process (RLIMIT_CPU), None for no limit
+        memory (int | None): the address space of each process in bytes (RLIMIT_AS), None for no limit
+        kwargs: the arguments of subprocess.Popen, and input as for subprocess.run
+
+    Returns:
+        subprocess.CompletedProcess: the outcome of the command
+    """
+
+    input = kwargs.pop("input", None)
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+
+    with subprocess.Popen(_limited(args, cpu_seconds, memory), start_new_session=True, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except BaseException:
+            _kill_group(process)
+            process.communicate()
+            raise
+
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def _limited(args: list[str], cpu_seconds: int | None, memory: int | None) -> list[str]:
+    """The command prefixed by prlimit with the limits, if any."""
+    if (cpu_seconds is None and memory is None) or _PRLIMIT is None:
+        return args
+    limits = [f"--cpu={cpu_seconds}"] if cpu_seconds is not None else []
+    limits += [f"--as={memory}"] if memory is not None else []
+    return [_PRLIMIT] + limits + ["--"] + args
+
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class AdaptiveTimeouts:
+    """Timeouts following the latency of the recent runs: the 99th percentile of the latencies of a key
+    times `factor`, between `minimum` and `maximum`.
+
+    A key with fewer than `min_samples` latencies uses the ones of its fallback key, e.g. of the same
+    compiler on every seed, and `maximum` if the fallback has too few as well.
+    """
+
+    def __init__(self, factor: float, minimum: float, maximum: float, window: int = 200, min_samples: int = 20):
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_samples = min_samples
+        self._latencies: dict[tuple, collections.deque] = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def observe(self, key: tuple, seconds: float, fallback: tuple | None = None):
+        """Record the latency of a run.
+
+        Args:
+            key (tuple): the key of the run, e.g. the seed and the compiler
+            seconds (float): the latency, or the timeout if it expired
+            fallback (tuple | None): the fallback key, which records the latency too
+        """
+        self._latencies[key].append(seconds)
+        if fallback is not None:
+            self._latencies[fallback].append(seconds)
+
+    def timeout(self, key: tuple, fallback: tuple | None = None) -> float:
+        """The timeout of the next run with the given key."""
+        for k in (key, fallback):
+            latencies = self._latencies.get(k)
+            if latencies is not None and len(latencies) >= self.min_samples:
+                ordered = sorted(latencies)
+                p99 = ordered[math.ceil(0.99 * len(ordered)) - 1]
+                return min(max(p99 * self.factor, self.minimum), self.maximum)
+        return self.maximum
@@ -0,0 +1,167 @@
+import dataclasses
+import hashlib
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from modules.compiler import Compiler
+from modules.telemetry import telemetry
+from modules.test import Stats
+
+
+# nodes of the syntax tree that can be removed as a whole
+_REMOVABLE_PARENTS = ("translation_unit", "compound_statement")
+_KEPT_NODES = ("comment",)
+
+
+def _is_main(node) -> bool:
+    """Whether a node of the syntax tree is the definition of main."""
+    if node.type != "function_definition":
+        return False
+    declarator = node.child_by_field_name("declarator")
+    while declarator is not None and declarator.type != "function_declarator":
+        declarator = declarator.child_by_field_name("declarator")
+    name = declarator.child_by_field_name("declarator") if declarator is not None else None
+    return name is not None and name.text == b"main"
+
+
+def _syntax_units(content: str) -> list[tuple[int, int]] | None:
+    """The spans of the top-level declarations and functions and of the statements of every block, outermost first.
+    None if tree-sitter is not installed."""
+    try:
+        from modules.ast_extractor import parse
+        tree = parse(content.encode("ISO-8859-1"))
+    except ImportError:
+        return None
+
+    units = []
+    queue = [tree.root_node]
+    while queue:
+        node = queue.pop(0)
+        for child in node.named_children:
+            if node.type in _REMOVABLE_PARENTS and child.type not in _KEPT_NODES and not _is_main(child):
+                units.append((child.start_byte, child.end_byte))
+            queue.append(child)
+    return units
+
+
+def _line_units(content: str) -> list[tuple[int, int]]:
+    """The spans of the non-empty lines of a content."""
+    units = []
+    start = 0
+    for line in content.splitlines(keepends=True):
+        if line.strip():
+            units.append((start, start + len(line)))
+        start += len(line)
+    return units
+
+
+def _remove(content: str, spans: list[tuple[int, int]]) -> str:
+    """Remove the spans from a content, together with the indentation and the end of their line if nothing else is left on it."""
+    pieces = []
+    last = 0
+    for start, end in sorted(spans):
+        if start < last:
+            # nested in a span already removed
+            start = last
+        line_start = content.rfind("\n", 0, start) + 1
+        if not content[line_start:start].strip():
+            start = max(line_start, last)
+        line_end = content.find("\n", end)
+        if line_end != -1 and not content[end:line_end].strip():
+            end = line_end + 1
+        pieces.append(content[last:start])
+        last = max(last, end)
+    pieces.append(content[last:])
+    return "".join(pieces)
+
+
+class Reducer:
+    """Reduces the interesting tests to the parts that keep them interesting, like C-Reduce.
+
+    Chunks of top-level declarations, functions and statements (of lines, without tree-sitter)
+    are removed, halving the size of the chunks down to a single one, until no removal is left
+    that keeps the rateo with the same older compiler over the interesting threshold and the
+    test ASAN safe. The candidates of a round are compiled in parallel and the verdicts are
+    cached by the hash of the content.
+    """
+
+    def __init__(self, compiler: Compiler, workers: int = 1):
+        self.compiler = compiler
+        self.workers = max(workers, 1)
+        self._verdicts: dict[str, Stats | None] = {}
+        self._ids = itertools.count()
+
+    def reduce(self, stats: Stats) -> Stats:
+        """Reduce an interesting test.
+
+        Args:
+            stats (Stats): the stats of the interesting test
+
+        Returns:
+            Stats: the stats of the reduced test, the original ones if nothing could be removed
+        """
+
+        older = stats.max_rateo[1]
+        best = None
+        content = stats.file_content
+
+        with telemetry.time("reduce"), ThreadPoolExecutor(max_workers=self.workers) as executor:
+            reduced = True
+            while reduced:
+                reduced = False
+                units = _syntax_units(content)
+                if units is None:
+                    units = _line_units(content)
+
+                size = max(len(units) // 2, 1)
+                while size >= 1 and units:
+                    candidates = [_remove(content, units[i:i + size]) for i in range(0, len(units), size)]
+                    accepted = self._first_accepted(executor, stats, older, candidates)
+                    if accepted is None:
+                        size //= 2
+                        continue
+
+                    best = accepted
+                    content = accepted.file_content
+                    reduced = True
+                    units = _syntax_units(content)
+                    if units is None:
+                        units = _line_units(content)
+                    size = min(size, max(len(units) // 2, 1))
+
+        if best is None:
+            return stats
+
+        return dataclasses.replace(best, file_name=stats.file_name, strategy_mutation=stats.strategy_mutation)
+
+    def _first_accepted(self, executor: ThreadPoolExecutor, stats: Stats, older: str, candidates: list[str]) -> Stats | None:
+        """Evaluate the candidates a window of `workers` at a time, returning the first one in order that is still interesting."""
+        for window in range(0, len(candidates), self.workers):
+            results = executor.map(lambda content: self._evaluate(stats, older, content), candidates[window:window + self.workers])
+            for result in results:
+                if result is not None:
+                    return result
+        return None
+
+    def _evaluate(self, stats: Stats, older: str, content: str) -> Stats | None:
+        """Compile a candidate, returning its stats if it keeps the rateo with the older compiler and it is ASAN safe."""
+        # the verdict depends on the older compiler and on whether the candidate must be tested with ASAN too
+        key = hashlib.sha256(f"{older}\0{stats.asan_tested}\0".encode() + content.encode("utf-8", "surrogateescape")).hexdigest()
+        if key in self._verdicts:
+            telemetry.count("reduce_candidate", "cached")
+            return self._verdicts[key]
+        telemetry.count("reduce_candidate", "evaluated")
+
+        # a name of its own, since the candidates are compiled concurrently next to the seed
+        name = f"{os.path.splitext(stats.file_name)[0]}_r{next(self._ids)}.c"
+        candidate = Stats(file_path=stats.file_path, file_name=name, file_content=content)
+        self.compiler.compile_stats(candidate, older)
+
+        interesting = candidate.max_rateo[1] == older and candidate.is_interesting()
+        if interesting:
+            safe = self.compiler.is_asan_safe(candidate, "last") and self.compiler.is_asan_safe(candidate, older)
+            # e.g. without main the program cannot be linked, so it cannot be tested either
+            interesting = safe and (candidate.asan_tested or not stats.asan_tested)
+
+        self._verdicts[key] = candidate if interesting else None
+        return self._verdicts[key]
@@ -0,0 +1,230 @@
+import dataclasses
+import json
+import os
+import platform
+import sqlite3
+import time
+from modules.test import Stats
+
+
+_COLUMNS = ("seed", "file_name", "compiler", "older_compiler", "last_value", "older_value", "ratio", "strategy", "asan_tested", "error_message", "flags", "system", "machine", "content", "stats", "created", "reduced", "reduced_ratio")
+
+
+def finding_record(s: Stats, compiler: str, flags: list[str]) -> dict:
+    """The record of an interesting test, as stored in the results database.
+
+    Args:
+        s (Stats): the stats of the interesting test
+        compiler (str): the current compiler
+        flags (list[str]): the flags used to compile the test
+
+    Returns:
+        dict: the record, with a key for each column of the database
+    """
+    return {
+        "seed": s.file_path,
+        "file_name": s.file_name,
+        "compiler": compiler,
+        "older_compiler": s.max_rateo[1],
+        "last_value": s.compiler_stats["last"],
+        "older_value": s.compiler_stats[s.max_rateo[1]],
+        "ratio": s.max_rateo[0],
+        "strategy": s.strategy_mutation,
+        "asan_tested": int(s.asan_tested),
+        "error_message": s.error_message,
+        "flags": " ".join(flags),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "content": s.file_content,
+        "stats": json.dumps(dataclasses.asdict(s)),
+        "created": time.time(),
+        "reduced": s.reduced_content,
+        "reduced_ratio": None,
+    }
+
+
+def legacy_text(record: dict) -> str:
+    """The content of the legacy .txt file of a finding: a CSV header, the flags and the test."""
+    header = f"{record['seed']},{record['compiler']},{record['older_compiler']},{record['last_value']},{record['older_value']},{record['ratio']},{record['strategy']},{'ASAN tested' if record['asan_tested'] else 'ASAN could not be tested'},{record['error_message']}\n"
+    return header + f"Flags: {record['flags']} - Compiled for {record['system']} - {record['machine']}\n" + record["content"]
+
+
+def write_legacy(record: dict, directory: str, used_names: set[str]) -> str:
+    """Write the legacy .txt file of a finding, appending '_' to the name until it is not used.
+
+    Args:
+        record (dict): the finding
+        directory (str): the output directory
+        used_names (set[str]): the names already in the directory, updated with the new one
+
+    Returns:
+        str: the path of the written file
+    """
+    name = os.path.splitext(record["file_name"])[0] + ".txt"
+    while name in used_names:
+        name += "_"
+    used_names.add(name)
+
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(legacy_text(record))
+    return path
+
+
+def reduced_text(record: dict) -> str:
+    """The content of the reduced test of a finding, after a comment comparing it with the original one."""
+    return (f"/* {record['seed']}: {record['compiler']} vs {record['older_compiler']}, rateo {record['reduced_ratio']} ({record['ratio']} before the reduction), "
+            f"{len(record['reduced'])} of {len(record['content'])} bytes */\n") + record["reduced"]
+
+
+def write_reduced(record: dict, directory: str) -> str:
+    """Write the reduced test of a finding in the reduced folder of a directory, appending '_' to the name until it is not used.
+
+    Args:
+        record (dict): the finding, with its reduced test
+        directory (str): the output directory
+
+    Returns:
+        str: the path of the written file
+    """
+    directory = os.path.join(directory, "reduced")
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, os.path.splitext(record["file_name"])[0] + ".c")
+    while os.path.exists(path):
+        path = os.path.splitext(path)[0] + "_.c"
+
+    with open(path, "w") as f:
+        f.write(reduced_text(record))
+    return path
+
+
+class ResultsStore:
+    """SQLite database of the interesting tests, indexed by seed, older compiler, ratio and strategy.
+    It is only written by the main process.
+    """
+
+    SCHEMA_VERSION = 2
+    INDEXED = ("seed", "older_compiler", "ratio", "strategy")
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, 1, self.SCHEMA_VERSION):
+                raise ValueError(f"Unsupported results database version {version}: {path}")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS findings (
+                id INTEGER PRIMARY KEY,
+                seed TEXT NOT NULL, file_name TEXT NOT NULL, compiler TEXT NOT NULL, older_compiler TEXT NOT NULL,
+                last_value INTEGER NOT NULL, older_value INTEGER NOT NULL, ratio REAL NOT NULL, strategy TEXT NOT NULL,
+                asan_tested INTEGER NOT NULL, error_message TEXT, flags TEXT NOT NULL, system TEXT NOT NULL, machine TEXT NOT NULL,
+                content TEXT NOT NULL, stats TEXT NOT NULL, created REAL NOT NULL, reduced TEXT, reduced_ratio REAL)""")
+            if version == 1:
+                self.connection.execute("ALTER TABLE findings ADD COLUMN reduced TEXT")
+                self.connection.execute("ALTER TABLE findings ADD COLUMN reduced_ratio REAL")
+            for column in self.INDEXED:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS findings_{column} ON findings({column})")
+            self.connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def add(self, record: dict) -> int:
+        """Store a finding.
+
+        Args:
+            record (dict): the finding, see finding_record
+
+        Returns:
+            int: the id of the finding
+        """
+        with self.connection:
+            cursor = self.connection.execute(f"INSERT INTO findings ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                                             [record[column] for column in _COLUMNS])
+        return cursor.lastrowid
+
+    def set_reduced(self, record: dict):
+        """Store the reduced test of a finding, adding the finding if it is not stored yet, e.g. loaded from a checkpoint.
+
+        Args:
+            record (dict): the finding, see finding_record, with its reduced test and rateo
+        """
+        with self.connection:
+            updated = self.connection.execute("UPDATE findings SET reduced = ?, reduced_ratio = ? WHERE seed = ? AND content = ?",
+                                              (record["reduced"], record["reduced_ratio"], record["seed"], record["content"])).rowcount
+        if not updated:
+            self.add(record)
+
+    def query(self, seed: str | None = None, older_compiler: str | None = None, min_ratio: float | None = None,
+              strategy: str | None = None, limit: int | None = None, columns: tuple[str, ...] | None = None) -> list[dict]:
+        """Find the findings matching all the given filters, the highest ratio first.
+
+        Args:
+            seed (str | None): the path of the seed, with SQL LIKE wildcards
+            older_compiler (str | None): the older compiler with the max ratio
+            min_ratio (float | None): the minimum ratio
+            strategy (str | None): the mutation strategy
+            limit (int | None): the maximum number of findings
+            columns (tuple[str, ...] | None): the columns to read, all of them if None
+
+        Returns:
+            list[dict]: the matching findings
+        """
+        sql, parameters = self._select(", ".join(columns) if columns else "*", seed, older_compiler, min_ratio, strategy, limit)
+        return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def count(self, seed: str | None = None, older_compiler: str | None = None, min_ratio: float | None = None,
+              strategy: str | None = None, limit: int | None = None) -> dict[str, int]:
+        """Count the findings matching all the given filters per older compiler, without reading them.
+
+        Args:
+            seed (str | None): the path of the seed, with SQL LIKE wildcards
+            older_compiler (str | None): the older compiler with the max ratio
+            min_ratio (float | None): the minimum ratio
+            strategy (str | None): the mutation strategy
+            limit (int | None): count only the findings with the highest ratio, up to this number
+
+        Returns:
+            dict[str, int]: the number of findings of each older compiler
+        """
+        if limit is None:
+            sql, parameters = self._select("older_compiler, COUNT(*)", seed, older_compiler, min_ratio, strategy, group_by="older_compiler")
+        else:
+            sql, parameters = self._select("older_compiler", seed, older_compiler, min_ratio, strategy, limit)
+            sql = f"SELECT older_compiler, COUNT(*) FROM ({sql}) GROUP BY older_compiler"
+        return dict(tuple(row) for row in self.connection.execute(sql, parameters))
+
+    def _select(self, columns: str, seed: str | None, older_compiler: str | None, min_ratio: float | None, strategy: str | None,
+                limit: int | None = None, group_by: str | None = None) -> tuple[str, list]:
+        """The SELECT of the given columns of the findings matching all the given filters, with its parameters."""
+        conditions, parameters = [], []
+        if seed is not None:
+            conditions.append("seed LIKE ?")
+            parameters.append(seed)
+        if older_compiler is not None:
+            conditions.append("older_compiler = ?")
+            parameters.append(older_compiler)
+        if min_ratio is not None:
+            conditions.append("ratio >= ?")
+            parameters.append(min_ratio)
+        if strategy is not None:
+            conditions.append("strategy = ?")
+            parameters.append(strategy)
+
+        sql = f"SELECT {columns} FROM findings"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_by is not None:
+            sql += f" GROUP BY {group_by}"
+        else:
+            sql += " ORDER BY ratio DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        return sql, parameters
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,121 @@
+import heapq
+import random
+from modules.journal import SeedProgress
+
+
+class SeedScheduler:
+    """Chooses the next seed to fuzz and how many mutations it gets, AFL style.
+
+    Every seed is fuzzed once per cycle, the seeds visited fewer times first and, among them, the
+    ones with more energy first. The energy is the number of mutations the seed gets: it grows
+    when the best rateo of the seed rises or when the seed compiles faster than the average, and
+    it decays when the seed does not compile, times out or stays at rateo 1.0.
+    Without `energy` every seed gets the base energy, i.e. the seeds are shuffled at every cycle.
+    """
+
+    BASE_ENERGY = 50
+    MIN_ENERGY = 10
+    MAX_ENERGY = 400
+    MAX_FAILURES = 3
+    """Number of consecutive runs without a compiled mutant after which a seed is retired."""
+
+    def __init__(self, seeds: list[int], energy: bool = True):
+        self.use_energy = energy
+        self.energy = {seed: self.BASE_ENERGY for seed in seeds}
+        self.visits = {seed: 0 for seed in seeds}
+        self.best_rateo = {seed: 0.0 for seed in seeds}
+        self.failures = {seed: 0 for seed in seeds}
+        self.found: set[int] = set()
+        self.retired: set[int] = set()
+        self._compile_seconds = 0.0
+        self._compiles = 0
+        self._queue = []
+        for seed in seeds:
+            self._push(seed)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _push(self, seed: int):
+        heapq.heappush(self._queue, (self.visits[seed], -self.energy[seed], random.random(), seed))
+
+    def restore(self, states: dict[int, SeedProgress]):
+        """Restore the state of the seeds from a previous run of the campaign, rebuilding the queue once.
+
+        Args:
+            states (dict[int, SeedProgress]): the state of each seed, by seed
+        """
+        for seed, state in states.items():
+            self.visits[seed] = state.visits
+            self.best_rateo[seed] = state.best_rateo
+            self.failures[seed] = state.failures
+            # without energy every seed gets the base energy and none is retired, whatever the previous run did
+            if self.use_energy:
+                if state.energy is not None:
+                    self.energy[seed] = state.energy
+                if state.retired:
+                    self.retired.add(seed)
+        self._queue = [(self.visits[s], -self.energy[s], random.random(), s) for *_, s in self._queue if s not in self.retired]
+        heapq.heapify(self._queue)
+
+    def next(self) -> tuple[int, int] | None:
+        """Take the next seed to fuzz. The seed is not scheduled again until it is updated.
+
+        Returns:
+            tuple[int, int] | None: the seed and its number of mutations, None if no seed is waiting
+        """
+        if not self._queue:
+            return None
+        *_, seed = heapq.heappop(self._queue)
+        return seed, self.energy[seed]
+
+    def update(self, seed: int, best_rateo: float, compile_seconds: float | None = None):
+        """Update the energy of a seed after a run without findings and schedule it again.
+
+        Args:
+            seed (int): the seed
+            best_rateo (float): the best rateo reached by the mutants of the run, 0 if none compiled
+            compile_seconds (float | None): the mean compilation time of the run, if any compilation ran
+        """
+        self.visits[seed] += 1
+
+        if self.use_energy:
+            energy = self.energy[seed]
+            if best_rateo == 0:
+                self.failures[seed] += 1
+                energy /= 2
+            else:
+                self.failures[seed] = 0
+                if best_rateo > max(self.best_rateo[seed], 1.0):
+                    energy *= 2
+                elif best_rateo <= 1.0:
+                    energy /= 2
+                else:
+                    energy *= 0.75
+
+            if compile_seconds is not None:
+                if self._compiles > 0:
+                    mean = self._compile_seconds / self._compiles
+                    if compile_seconds < mean / 2:
+                        energy *= 1.5
+                    elif compile_seconds > mean * 2:
+                        energy /= 2
+                self._compile_seconds += compile_seconds
+                self._compiles += 1
+
+            self.energy[seed] = int(min(max(energy, self.MIN_ENERGY), self.MAX_ENERGY))
+            self.best_rateo[seed] = max(self.best_rateo[seed], best_rateo)
+
+            if self.failures[seed] >= self.MAX_FAILURES:
+                self.retired.add(seed)
+                return
+
+        self._push(seed)
+
+    def requeue(self, seed: int):
+        """Schedule again a seed taken with next that was not run, e.g. since its lease expired."""
+        self._push(seed)
+
+    def mark_found(self, seed: int):
+        """Stop scheduling a seed since an interesting mutation was found."""
+        self.found.add(seed)
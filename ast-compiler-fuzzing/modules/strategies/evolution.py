@@ -0,0 +1,69 @@
+import random
+from modules.test import FuzzedTest, MutatedInputs
+
+
+class Population:
+    """Population of the mutants of a seed for the evolutionary search.
+
+    The population keeps the `size` compiled mutants with the best rateo among the parents and
+    their offspring, so the best mutants always survive. Parents are chosen by tournament and
+    crossed over input by input. The search has reached a plateau when the best rateo did not
+    improve for `patience` generations.
+    """
+
+    TOURNAMENT = 3
+    CROSSOVER_RATE = 0.7
+
+    def __init__(self, size: int = 16, patience: int = 3):
+        self.size = size
+        self.patience = patience
+        self.individuals: list[FuzzedTest] = []
+        self.stalled = 0
+
+    @property
+    def best(self) -> FuzzedTest | None:
+        return self.individuals[0] if self.individuals else None
+
+    @property
+    def plateau(self) -> bool:
+        """Whether the best rateo stopped improving."""
+        return self.stalled >= self.patience
+
+    def add_generation(self, generation: list[FuzzedTest]):
+        """Add the compiled offspring, keeping the best individuals of the parents and the offspring.
+
+        Args:
+            generation (list[FuzzedTest]): the compiled offspring
+        """
+        best_rateo = self.best.stats.max_rateo[0] if self.individuals else 0
+        self.individuals = sorted(self.individuals + generation, key=lambda x: x.stats.max_rateo[0], reverse=True)[:self.size]
+
+        if self.best is not None and self.best.stats.max_rateo[0] > best_rateo:
+            self.stalled = 0
+        else:
+            self.stalled += 1
+
+    def select(self) -> MutatedInputs:
+        """Choose a parent by tournament: the best of a few random individuals."""
+        contenders = random.sample(self.individuals, min(self.TOURNAMENT, len(self.individuals)))
+        return max(contenders, key=lambda x: x.stats.max_rateo[0]).mutated_inputs
+
+    def offspring(self) -> MutatedInputs:
+        """The inputs of a child, crossing over two parents or copying one, to be mutated."""
+        parent = self.select()
+        if len(self.individuals) < 2 or random.random() >= self.CROSSOVER_RATE:
+            return parent
+        return self.crossover(parent, self.select())
+
+    @staticmethod
+    def crossover(a: MutatedInputs, b: MutatedInputs) -> MutatedInputs:
+        """Uniform crossover: each input takes the value of either parent.
+
+        Args:
+            a (MutatedInputs): the inputs of the first parent
+            b (MutatedInputs): the inputs of the second parent, over the same seed
+
+        Returns:
+            MutatedInputs: the inputs of the child
+        """
+        return a.with_values({i: b.value(i) for i in set(a.changes) | set(b.changes) if random.random() < 0.5})
@@ -1,13 +1,12 @@
 import random
-from datetime import datetime
+import time
 
 from modules.strategies.random import Random
 from modules.strategies.boundaries import Boundaries
 from modules.strategies.modification import Modification
+from modules.telemetry import telemetry
 from modules.test import Input
 
-import matplotlib.pyplot as plt
-
 class Mutator:
     
     
@@ -18,10 +17,11 @@ class Mutator:
              "Modification":  Modification(),
         }
         
+        # number of mutations per strategy
         self.heuristic_stats = {
-            "Random": [],
-            "Boundaries": [],
-            "Modification": [],
+            "Random": 0,
+            "Boundaries": 0,
+            "Modification": 0,
         }
         self.STRATEGY_TRIES = [*(["Random"] * 20 +["Boundaries"] * 5 + ["Modification"] * 10)] * 4
         
@@ -34,30 +34,34 @@ class Mutator:
         elif 0.75 <= index <= 1:
             return "Modification"
         
-    def mutate(self, input: Input) -> str:
-        try: 
-            strategy_index = random.uniform(0, 1)
-            strategy_name = self.strategy(strategy_index)
-            mutated_value =  self.strategies[strategy_name].mutate(input)
-        except ValueError as e:
-            strategy_name = "Random"
-            mutated_value =  self.strategies[strategy_name].mutate(input)
-        self.heuristic_stats[strategy_name] += [datetime.now()]
-        return mutated_value
-    
-    def mutate(self, input: Input, strategy_name: str) -> str:
+    def mutate(self, input: Input, strategy_name: str | None = None) -> str:
+        """Mutate the value of an input.
+
+        Args:
+            input (Input): the input to mutate
+            strategy_name (str | None): the strategy to use, if None it is drawn with fixed probabilities
+
+        Returns:
+            str: the mutated value
+        """
+        start = time.perf_counter()
         try: 
+            if strategy_name is None:
+                strategy_name = self.strategy(random.uniform(0, 1))
             mutated_value = self.strategies[strategy_name].mutate(input)
         except ValueError as e:
             strategy_name = "Random"
             mutated_value =  self.strategies[strategy_name].mutate(input)
-        self.heuristic_stats[strategy_name] += [datetime.now()]
+        self.heuristic_stats[strategy_name] += 1
+        telemetry.observe("mutate", strategy_name, time.perf_counter() - start)
         return mutated_value
     
     def plot(self):
+        # imported here since matplotlib is slow to import and only needed for plotting
+        import matplotlib.pyplot as plt
                 
-        strategies = [self.strategies_names[i] for i in self.heuristic_stats.keys()]
-        count = [len(self.heuristic_stats[key]) for key in self.heuristic_stats]
+        strategies = list(self.heuristic_stats.keys())
+        count = list(self.heuristic_stats.values())
         
         fig = plt.figure(figsize = (10, 5))
         
@@ -0,0 +1,68 @@
+import math
+import random
+
+
+class StrategyScheduler:
+    """Multi-armed bandit (UCB1) choosing the mutation strategy to try next.
+
+    The statistics are kept per type of input, since a strategy that works well on integers
+    may be useless on strings. A strategy that does not improve the rateo for `patience`
+    consecutive tries is retired for that type.
+    """
+
+    EXPLORATION = math.sqrt(2)
+
+    def __init__(self, strategies: list[str], patience: int = 20):
+        self.strategies = strategies
+        self.patience = patience
+        self.tries = {}
+        self.rewards = {}
+        self.stalls = {}
+
+    def _active(self, input_type: str) -> list[str]:
+        return [strategy for strategy in self.strategies if self.stalls.get((input_type, strategy), 0) < self.patience]
+
+    def exhausted(self, input_type: str) -> bool:
+        """Whether every strategy stalled for the given type."""
+        return len(self._active(input_type)) == 0
+
+    def choose(self, input_type: str) -> str:
+        """Choose the strategy to try on an input of the given type.
+
+        Args:
+            input_type (str): the type of the input
+
+        Returns:
+            str: the name of the strategy
+        """
+        active = self._active(input_type)
+
+        untried = [strategy for strategy in active if self.tries.get((input_type, strategy), 0) == 0]
+        if untried:
+            return random.choice(untried)
+
+        total = sum(self.tries[(input_type, strategy)] for strategy in active)
+
+        def upper_bound(strategy: str) -> float:
+            n = self.tries[(input_type, strategy)]
+            return self.rewards[(input_type, strategy)] / n + self.EXPLORATION * math.sqrt(math.log(total) / n)
+
+        return max(active, key=upper_bound)
+
+    def update(self, input_type: str, strategy: str, best_rateo: float, rateo: float):
+        """Reward a strategy with the relative improvement of the rateo it produced over the best one of the input,
+        so that compiling again after a mutant that failed is not rewarded.
+
+        Args:
+            input_type (str): the type of the mutated input
+            strategy (str): the strategy used
+            best_rateo (float): the best rateo reached on the input before the mutation, 0 if nothing compiled
+            rateo (float): the rateo after the mutation
+        """
+        key = (input_type, strategy)
+        improvement = (rateo - best_rateo) / best_rateo if best_rateo > 0 else 0.0
+        reward = min(max(improvement, 0.0), 1.0)
+
+        self.tries[key] = self.tries.get(key, 0) + 1
+        self.rewards[key] = self.rewards.get(key, 0.0) + reward
+        self.stalls[key] = 0 if reward > 0 else self.stalls.get(key, 0) + 1
@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+
+BUCKETS = tuple(0.001 * 2 ** i for i in range(18))
+"""Upper bounds in seconds of the latency histograms, from 1ms to about 2 minutes."""
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, so that its memory does not grow with the observations."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, counts: list[int], total: float, count: int):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile with the upper bound of the bucket it falls in."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Telemetry:
+    """Counters and latency histograms per stage of the fuzzer.
+
+    Each process records in its own instance; the workers send what they recorded to the main
+    process with drain(), which merges it with merge().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, str], int] = {}
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+
+    def __getstate__(self):
+        return self.snapshot()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.merge(state)
+
+    def count(self, stage: str, label: str = "", n: int = 1):
+        """Increment the counter of a stage."""
+        with self._lock:
+            self.counters[(stage, label)] = self.counters.get((stage, label), 0) + n
+
+    def observe(self, stage: str, label: str, seconds: float):
+        """Record the latency of a stage."""
+        with self._lock:
+            if (stage, label) not in self.histograms:
+                self.histograms[(stage, label)] = Histogram()
+            self.histograms[(stage, label)].observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str, label: str = ""):
+        """Record the latency of the wrapped block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, label, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """The recorded data as plain, picklable structures."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {key: (list(h.counts), h.sum, h.count) for key, h in self.histograms.items()},
+            }
+
+    def drain(self) -> dict:
+        """Return the recorded data and reset it."""
+        with self._lock:
+            data = {
+                "counters": self.counters,
+                "histograms": {key: (h.counts, h.sum, h.count) for key, h in self.histograms.items()},
+            }
+            self.counters = {}
+            self.histograms = {}
+        return data
+
+    def merge(self, data: dict | None):
+        """Merge the data drained from another process."""
+        if not data:
+            return
+        with self._lock:
+            for key, n in data["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + n
+            for key, (counts, total, count) in data["histograms"].items():
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].merge(counts, total, count)
+
+    def to_record(self) -> dict:
+        """A summary of the recorded data for the JSONL log."""
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": {f"{stage}/{label}": n for (stage, label), n in self.counters.items()},
+                "latency": {f"{stage}/{label}": {"count": h.count, "sum": round(h.sum, 6), "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                            for (stage, label), h in self.histograms.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """The recorded data in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE fuzzer_events_total counter")
+            for (stage, label), n in sorted(self.counters.items()):
+                lines.append(f'fuzzer_events_total{{stage="{stage}",label="{label}"}} {n}')
+
+            lines.append("# TYPE fuzzer_stage_seconds histogram")
+            for (stage, label), h in sorted(self.histograms.items()):
+                labels = f'stage="{stage}",label="{label}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.counts):
+                    cumulative += n
+                    lines.append(f'fuzzer_stage_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'fuzzer_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"fuzzer_stage_seconds_sum{{{labels}}} {h.sum}")
+                lines.append(f"fuzzer_stage_seconds_count{{{labels}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+class TelemetryWriter:
+    """Periodically writes the telemetry as JSONL records and as a Prometheus textfile."""
+
+    def __init__(self, directory: str, interval: float = 30):
+        self.directory = directory
+        self.interval = interval
+        self._last_write = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, telemetry: Telemetry, force: bool = False):
+        """Write the telemetry if the interval elapsed since the last write, or if forced."""
+        if not force and time.monotonic() - self._last_write < self.interval:
+            return
+        self._last_write = time.monotonic()
+
+        with open(os.path.join(self.directory, "telemetry.jsonl"), "a") as f:
+            f.write(json.dumps(telemetry.to_record()) + "\n")
+
+        # written atomically since the textfile collector may read it at any time
+        prom_path = os.path.join(self.directory, "fuzzer.prom")
+        with open(prom_path + ".tmp", "w") as f:
+            f.write(telemetry.to_prometheus())
+        os.replace(prom_path + ".tmp", prom_path)
+
+
+telemetry = Telemetry()
+"""Telemetry of the current process."""
+
+
+def reset_telemetry():
+    """Discard the telemetry of the current process, e.g. the one inherited by a forked worker."""
+    telemetry.drain()
@@ -1,12 +1,16 @@
+from collections.abc import Mapping
 import dataclasses
 import platform
 from typing import Any
 import re
 
 
-@dataclasses.dataclass
+_PLACEHOLDER = re.compile(r"\[INPUT_(\d+)\]")
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
 class Input:
-    """Input object."""
+    """Input object. It is immutable and shared by all the mutants of a seed, see MutatedInputs."""
     
     name : str
     """Name of the variable."""
@@ -26,14 +30,12 @@ class Input:
     len : int = None
     """Length of the variable, if array or string and available, else None."""
 
-    interesting: bool = True
+    span: tuple[int, int] | None = None
+    """Start and end offsets in the source of the test of the text the input replaces, only set by the ast extractor."""
     
     
     def __post_init__(self):
-        self.len = self._infer_len()
-        
-    def __eq__(self, __o: object) -> bool:
-        return type(__o) == Input and dataclasses.asdict(self) == dataclasses.asdict(__o)
+        object.__setattr__(self, "len", self._infer_len())
     
     def _infer_len(self):
         """Infer length if not available and is array or string."""
@@ -45,6 +47,127 @@ class Input:
             return len(is_string.group('content')) + 1
         
 
+    def render(self, value: str | None = None) -> str:
+        """The declaration or assignment of the input, as it replaces its placeholder.
+
+        Args:
+            value (str | None): the value to assign, the one of the input if None
+        """
+        array = f"[{self.len}]" if self.len is not None else ""
+        return f"{self.name}{array} = {self.value if value is None else value}"
+
+
+class MutatedInputs(Mapping):
+    """The inputs of a mutant: the inputs of the seed are shared, only the changed values are stored.
+    Mutating returns a new object, so mutants never share state and can be hashed to find duplicates.
+    """
+    
+    __slots__ = ("base", "changes", "boring", "_hash")
+    
+    def __init__(self, base: dict[int, Input], changes: dict[int, str] | None = None, boring: frozenset[int] = frozenset()):
+        self.base = base
+        """The inputs of the seed."""
+        self.changes = changes if changes is not None else {}
+        """The values that differ from the seed, by input index."""
+        self.boring = boring
+        """The inputs that do not affect the result, found by the reduction."""
+        self._hash = None
+    
+    def __getitem__(self, i: int) -> Input:
+        if i in self.changes:
+            return dataclasses.replace(self.base[i], value=self.changes[i])
+        return self.base[i]
+    
+    def __iter__(self):
+        return iter(self.base)
+    
+    def __len__(self):
+        return len(self.base)
+    
+    def __eq__(self, __o: object) -> bool:
+        return type(__o) == MutatedInputs and self.base is __o.base and self.changes == __o.changes and self.boring == __o.boring
+    
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((id(self.base), frozenset(self.changes.items()), self.boring))
+        return self._hash
+    
+    def value(self, i: int) -> str:
+        """The current value of an input."""
+        return self.changes.get(i, self.base[i].value)
+    
+    def values_by_index(self) -> dict[int, str]:
+        """The current value of every input."""
+        return {i: self.changes.get(i, input.value) for i, input in self.base.items()}
+    
+    def render(self, i: int) -> str:
+        """The text replacing the placeholder of an input."""
+        return self.base[i].render(self.changes.get(i))
+    
+    def is_interesting(self, i: int) -> bool:
+        """Whether the input affects the result, i.e. it is worth mutating."""
+        return i not in self.boring
+    
+    def with_values(self, values: dict[int, str]) -> "MutatedInputs":
+        """A copy with the given values changed."""
+        changes = dict(self.changes)
+        for i, value in values.items():
+            if value == self.base[i].value:
+                changes.pop(i, None)
+            else:
+                changes[i] = value
+        return MutatedInputs(self.base, changes, self.boring)
+    
+    def with_value(self, i: int, value: str) -> "MutatedInputs":
+        """A copy with the value of an input changed."""
+        return self.with_values({i: value})
+    
+    def reverted(self, i: int) -> "MutatedInputs":
+        """A copy with an input back to the value of the seed."""
+        changes = dict(self.changes)
+        changes.pop(i, None)
+        return MutatedInputs(self.base, changes, self.boring)
+    
+    def with_boring(self, i: int) -> "MutatedInputs":
+        """A copy marking an input as not affecting the result."""
+        return MutatedInputs(self.base, self.changes, self.boring | {i})
+
+
+class Template:
+    """A test pattern split once into its literal segments and the slots of the inputs between them."""
+    
+    __slots__ = ("segments", "slots")
+    
+    def __init__(self, pattern: str):
+        parts = _PLACEHOLDER.split(pattern)
+        self.segments: list[str] = parts[0::2]
+        """The text between the placeholders, one more than the slots."""
+        self.slots: list[int] = [int(i) for i in parts[1::2]]
+        """The index of the input of each placeholder, in order."""
+    
+    def __getstate__(self):
+        return self.segments, self.slots
+    
+    def __setstate__(self, state):
+        self.segments, self.slots = state
+    
+    def render(self, inputs: MutatedInputs) -> str:
+        """Render the test with the given inputs in a single join.
+        The placeholders of the inputs not given are kept.
+
+        Args:
+            inputs (MutatedInputs): the inputs to apply
+
+        Returns:
+            str: the test content
+        """
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(inputs.render(slot) if slot in inputs.base else f"[INPUT_{slot}]")
+            parts.append(segment)
+        return "".join(parts)
+
+
 @dataclasses.dataclass(frozen=True)
 class Test:
     """Test object."""
@@ -58,13 +181,18 @@ class Test:
     inputs: dict[int, Input]
     """Input values for the test."""
 
+    template: Template = dataclasses.field(default=None, compare=False, repr=False)
+    """The pattern split into segments and slots, built with the test."""
+
 
     def __post_init__(self):
+        if self.template is None:
+            object.__setattr__(self, "template", Template(self.file_pattern))
         for i, input in self.inputs.items():
             if not input.type:
                 for j in range(i-1, -1, -1):
-                    input.type =  self.inputs[j].type if input.name == self.inputs[j].name and input.scope >=  self.inputs[j].scope else None
-                    if input.type:
+                    if input.name == self.inputs[j].name and input.scope >=  self.inputs[j].scope and self.inputs[j].type:
+                        self.inputs[i] = dataclasses.replace(input, type=self.inputs[j].type)
                         break
     
     def has_valid_inputs(self) -> bool:
@@ -101,20 +229,53 @@ class Stats:
     
     error_message: str | None = None
     """Asan error message, if any."""
+
+    function_sizes: dict[str, dict[str, int]] = None
+    """Size in bytes of each function of the object code, for each compiler.
+    Only available with the size metric, in which case compiler_stats contains the size of the code.
+    """
+
+    executed_stats: dict[str, int] = None
+    """Number of instructions executed by the test built with the current compiler and the older one with the max rateo.
+    Only available when counting the executed instructions.
+    """
+
+    timed_out: list[str] | None = None
+    """The compilers whose compilation of the test timed out, and 'asan <compiler>' for the ASAN builds and runs that timed out.
+    A compiler that timed out has no stat, or 0 for the current one.
+    """
+
+    reduced_content: str | None = None
+    """Content of the test reduced to the parts that keep the rateo with the same older version.
+    Only available when the interesting tests are reduced.
+    """
     
 
-    def add_compiler_stat(self, compiler: str, stat: int):
+    def add_compiler_stat(self, compiler: str, stat: int, function_sizes: dict[str, int] | None = None):
         """Add a stat to the compiler stats.
 
         Arguments:
             compiler {str} -- The compiler to add the stat to.
             stat {int} -- The stat to add.
+            function_sizes {dict[str, int]} -- The size of each function, if available.
         """
         if self.compiler_stats is None:
             self.compiler_stats = {}
             
         self.compiler_stats[compiler] = stat
 
+        if function_sizes is not None:
+            if self.function_sizes is None:
+                self.function_sizes = {}
+            self.function_sizes[compiler] = function_sizes
+
+    def add_timeout(self, compiler: str):
+        """Record that the compilation or the ASAN check with a compiler timed out."""
+        if self.timed_out is None:
+            self.timed_out = []
+        if compiler not in self.timed_out:
+            self.timed_out.append(compiler)
+
     @property
     def n_tests(self):
         """Returns the number of tests."""
@@ -164,7 +325,7 @@ class FuzzedTest:
     stats: Stats | None
     """Stats of the fuzzed test. If None, the test has not been compiled yet."""
     
-    mutated_inputs: dict[int, Input]
+    mutated_inputs: MutatedInputs
     """The mutated inputs of the test."""
     
     def is_asan_safe(self, compiler) -> bool:
@@ -176,6 +337,23 @@ class FuzzedTest:
         return compiler.is_asan_safe(self.stats, "last") and compiler.is_asan_safe(self.stats, self.stats.max_rateo[1])
         
 
+    def runs_slower(self, compiler) -> bool:
+        """Whether the test built with the current compiler executes more instructions than with the older one.
+        If the instructions could not be counted, e.g. the cap was reached, the static ratio is trusted.
+
+        Returns:
+            bool: whether the test runs slower with the current compiler
+        """
+
+        last = compiler.count_instructions(self.stats, "last")
+        older = compiler.count_instructions(self.stats, self.stats.max_rateo[1])
+        self.stats.executed_stats = {key: value for key, value in (("last", last), (self.stats.max_rateo[1], older)) if value is not None}
+
+        if last is None or older is None:
+            return True
+
+        return last > older
+
     def has_improved(self, old_stats: Stats) -> bool:
         """Whether the fuzzed test is improved with respect to the previous mutation.
 
@@ -186,4 +364,35 @@ class FuzzedTest:
         if old_stats is None:
             return True
         
-        return self.stats.max_rateo[0] >= old_stats.max_rateo[0]
\ No newline at end of file
+        return self.stats.max_rateo[0] >= old_stats.max_rateo[0]
+
+@dataclasses.dataclass
+class TaskResult:
+    """The result of fuzzing a seed in a worker, kept small since it is sent back to the main process."""
+    
+    index: int
+    """Index of the seed in the tests of the fuzzer."""
+    
+    stats: Stats | None
+    """Stats of the interesting mutation, None if no interesting mutation was found."""
+    
+    best_rateo: float
+    """The best rateo reached by the mutants of the seed, 0 if none compiled."""
+    
+    compile_seconds: float | None
+    """The mean compilation time of the seed, None if every compilation was cached."""
+    
+    iterations: int
+    """Number of mutants compiled."""
+    
+    best_inputs: dict[int, str] | None
+    """Values of the inputs of the mutant with the best rateo, None if no mutant compiled."""
+    
+    strategies: dict[str, int]
+    """Number of tries of each mutation strategy."""
+    
+    telemetry: dict
+    """Telemetry recorded by the worker while fuzzing the seed."""
+
+    candidates: int = 0
+    """Number of interesting mutations sent to the main process to be validated with ASAN."""
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from modules.elf import is_elf
+
+
+_PROBE_PROGRAM = b"int main(void) { return 0; }\n"
+
+
+class ToolchainManifest:
+    """Cache of the resolved toolchain.
+
+    The manifest records the path, version and modification time of the main compiler and
+    of the older ones, along with their probed capabilities. It is reused as long as the
+    PATH and the compiler binaries do not change, so that startup does not need to look
+    up every compiler version nor spawn them.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def _mtime(path: str) -> int | None:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _path_dirs() -> dict[str, int | None]:
+        """Modification time of the PATH directories, they change when a compiler is installed or removed."""
+        return {d: ToolchainManifest._mtime(d) for d in os.environ.get("PATH", "").split(os.pathsep) if d}
+
+    @staticmethod
+    def _binary(compiler: str) -> dict:
+        path = os.path.realpath(shutil.which(compiler) or compiler)
+        return {"path": path, "mtime": ToolchainManifest._mtime(path)}
+
+    @staticmethod
+    def probe_asan(compiler: str) -> bool:
+        """Check whether the compiler can build and link a program with -fsanitize=address."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                result = subprocess.run([compiler, "-x", "c", "-", "-fsanitize=address", "-o", os.path.join(tmp_dir, "probe")],
+                                        input=_PROBE_PROGRAM, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=30)
+            except (subprocess.TimeoutExpired, OSError):
+                return False
+        return result.returncode == 0 and not result.stderr
+
+    @staticmethod
+    def probe_elf(compiler: str) -> bool:
+        """Check whether the compiler writes ELF objects, which the size metric reads."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, "probe.o")
+            try:
+                subprocess.run([compiler, "-x", "c", "-", "-c", "-o", output], input=_PROBE_PROGRAM, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+                with open(output, "rb") as f:
+                    return is_elf(f.read(4))
+            except (subprocess.TimeoutExpired, OSError):
+                return False
+
+    def load(self, compiler: str) -> dict | None:
+        """Load the manifest of the given main compiler.
+
+        Args:
+            compiler (str): the main compiler
+
+        Returns:
+            dict | None: the manifest, None if missing or if the toolchain changed since it was written
+        """
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != self.VERSION or manifest.get("compiler") != compiler:
+            return None
+
+        if manifest.get("path_dirs") != self._path_dirs():
+            return None
+
+        for binary in manifest["binaries"].values():
+            if self._mtime(binary["path"]) != binary["mtime"]:
+                return None
+
+        return manifest
+
+    def write(self, compiler: str, compiler_type: str, compiler_version: int, older_compilers: list[str]) -> dict:
+        """Probe the capabilities of the toolchain and write the manifest.
+
+        Args:
+            compiler (str): the main compiler
+            compiler_type (str): gcc or clang
+            compiler_version (int): the version of the main compiler
+            older_compilers (list[str]): the older compilers found
+
+        Returns:
+            dict: the manifest
+        """
+        compilers = [compiler] + older_compilers
+        manifest = {
+            "version": self.VERSION,
+            "compiler": compiler,
+            "compiler_type": compiler_type,
+            "compiler_version": compiler_version,
+            "older_compilers": older_compilers,
+            "path_dirs": self._path_dirs(),
+            "binaries": {c: self._binary(c) for c in compilers},
+            "asan": {c: self.probe_asan(c) for c in compilers},
+            "elf": {c: self.probe_elf(c) for c in compilers},
+        }
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+        return manifest
@@ -0,0 +1,96 @@
+import dataclasses
+import queue
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from modules.compiler import Compiler
+from modules.test import Stats
+
+
+@dataclasses.dataclass
+class Candidate:
+    """An interesting mutation sent by a worker to the main process, to be validated with ASAN."""
+
+    index: int
+    """Index of the seed in the tests of the fuzzer."""
+
+    stats: Stats
+    """Stats of the interesting mutation."""
+
+
+@dataclasses.dataclass
+class Verdict:
+    """The outcome of the ASAN validation of a candidate."""
+
+    index: int
+    """Index of the seed in the tests of the fuzzer."""
+
+    stats: Stats
+    """Stats of the candidate, with the outcome of the ASAN runs."""
+
+    safe: bool
+    """Whether the candidate is ASAN safe with the current compiler and the older one with the max rateo."""
+
+
+class AsanValidator:
+    """Validates the candidates of the workers with ASAN on a pool of threads of its own, sized independently
+    of the workers, so that the workers keep mutating while the sanitized binaries are built and run.
+
+    The verdicts are put in the `results` queue of the main process. Once a seed is confirmed, its candidates
+    that are still waiting are dropped.
+    """
+
+    def __init__(self, compiler: Compiler, workers: int, results: queue.Queue):
+        self.compiler = compiler
+        self.results = results
+        self.confirmed: set[int] = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asan")
+        self._futures: dict[int, list[Future]] = {}
+        self._waiting: dict[int, int] = {}
+
+    def submit(self, candidate: Candidate):
+        """Queue a candidate for validation, unless its seed is already confirmed."""
+        if candidate.index in self.confirmed:
+            return
+        future = self._executor.submit(self._validate, candidate)
+        self._futures.setdefault(candidate.index, []).append(future)
+        self._waiting[candidate.index] = self._waiting.get(candidate.index, 0) + 1
+        future.add_done_callback(self._put)
+
+    def _put(self, future: Future):
+        if not future.cancelled():
+            self.results.put(future.result())
+
+    def _validate(self, candidate: Candidate) -> Verdict:
+        """Validate a candidate. A candidate whose validation fails is not safe, so that it does not stop the campaign."""
+        stats = candidate.stats
+        try:
+            safe = self.compiler.is_asan_safe(stats, "last") and self.compiler.is_asan_safe(stats, stats.max_rateo[1])
+        except Exception:
+            print(f"Could not validate {stats.file_name} with ASAN, considered not safe")
+            traceback.print_exc()
+            safe = False
+        return Verdict(index=candidate.index, stats=stats, safe=safe)
+
+    def settle(self, verdict: Verdict):
+        """Count a verdict taken from the results queue."""
+        if verdict.index not in self._waiting:
+            # the seed was confirmed meanwhile
+            return
+        self._waiting[verdict.index] -= 1
+        if self._waiting[verdict.index] == 0:
+            del self._waiting[verdict.index]
+            del self._futures[verdict.index]
+
+    def pending(self, index: int) -> bool:
+        """Whether some candidates of a seed are still waiting for their verdict."""
+        return index in self._waiting
+
+    def confirm(self, index: int):
+        """Drop the candidates of a seed that are still waiting, since the seed has a validated mutation."""
+        self.confirmed.add(index)
+        self._waiting.pop(index, None)
+        for future in self._futures.pop(index, []):
+            future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
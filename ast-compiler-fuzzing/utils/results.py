@@ -0,0 +1,67 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from modules.results import ResultsStore, write_legacy, write_reduced
+
+
+_SUMMARY_COLUMNS = ("id", "seed", "older_compiler", "last_value", "older_value", "ratio", "strategy", "asan_tested")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query and export the interesting tests of the results database.")
+    parser.add_argument("database", help="Specify the results database")
+    parser.add_argument("--seed", help="Filter by seed path, with SQL LIKE wildcards (e.g. %%/gcc.c-torture/%%)", default=None)
+    parser.add_argument("--older-compiler", help="Filter by the older compiler with the max ratio", default=None)
+    parser.add_argument("--min-ratio", help="Filter by minimum ratio", default=None, type=float)
+    parser.add_argument("--strategy", help="Filter by mutation strategy", default=None)
+    parser.add_argument("--limit", help="Specify the maximum number of results", default=None, type=int)
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("query", help="Print the matching results as CSV")
+    subparsers.add_parser("count", help="Print the number of matching results per older compiler")
+    export = subparsers.add_parser("export", help="Export the matching results")
+    export.add_argument("-f", "--format", choices=["txt", "jsonl"], help="Specify the format: the legacy .txt files or a JSONL file", default="txt")
+    export.add_argument("-o", "--output", help="Specify the output directory (txt) or file (jsonl)", default="output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    store = ResultsStore(args.database)
+    filters = dict(seed=args.seed, older_compiler=args.older_compiler, min_ratio=args.min_ratio, strategy=args.strategy, limit=args.limit)
+
+    if args.command == "query":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(_SUMMARY_COLUMNS)
+        for record in store.query(**filters, columns=_SUMMARY_COLUMNS):
+            writer.writerow([record[column] for column in _SUMMARY_COLUMNS])
+
+    elif args.command == "count":
+        for compiler, count in sorted(store.count(**filters).items()):
+            print(f"{compiler}: {count}")
+
+    elif args.format == "txt":
+        records = store.query(**filters)
+        os.makedirs(args.output, exist_ok=True)
+        used_names = set(os.listdir(args.output))
+        for record in records:
+            write_legacy(record, args.output, used_names)
+            if record["reduced"] is not None:
+                write_reduced(record, args.output)
+        print(f"Exported {len(records)} results to {args.output}")
+
+    else:
+        records = store.query(**filters)
+        with open(args.output, "w") as f:
+            for record in records:
+                record["stats"] = json.loads(record["stats"])
+                f.write(json.dumps(record) + "\n")
+        print(f"Exported {len(records)} results to {args.output}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()